@@ -0,0 +1,114 @@
+"""Streaming decoding of data URI attachments"""
+
+import base64
+import re
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO
+from urllib.parse import unquote_to_bytes
+
+from .config import Environ
+from .models import Attachment
+
+# Characters of base64 text decoded per step, a multiple of 4
+CHUNK_CHARS = 64 * 1024
+WHITESPACE = re.compile(r"\s+")
+
+
+class AttachmentTooLarge(ValueError):
+    """Raised when an attachment exceeds the configured size limits"""
+
+
+def decode_attachment(attachment: Attachment, max_bytes: int) -> BinaryIO:
+    """Decode a data URI in chunks into a spooled temporary file"""
+    data = attachment.data
+    comma = data.find(",")
+    header = data[:comma] if comma != -1 else ""
+    spool = SpooledTemporaryFile(max_size=Environ.ATTACHMENT_SPOOL_BYTES)
+    written = 0
+
+    def write(chunk: bytes):
+        nonlocal written
+        written += len(chunk)
+        if written > max_bytes:
+            raise AttachmentTooLarge(
+                f"Attachment '{attachment.name}' exceeds {max_bytes} bytes"
+            )
+        spool.write(chunk)
+
+    try:
+        if _is_plain(header):
+            # Plain data URIs carry percent-encoded text, which is small
+            write(unquote_to_bytes(data[comma + 1 :]))
+        else:
+            carry = ""
+            for start in range(comma + 1, len(data), CHUNK_CHARS):
+                text = carry + WHITESPACE.sub("", data[start : start + CHUNK_CHARS])
+                # Decode whole 4-character groups and keep the rest for later
+                usable = len(text) - len(text) % 4
+                write(base64.b64decode(text[:usable]))
+                carry = text[usable:]
+            if carry:
+                write(base64.b64decode(carry + "=" * (-len(carry) % 4)))
+    except BaseException:
+        spool.close()
+        raise
+
+    spool.seek(0)
+    return spool
+
+
+def _is_plain(header: str) -> bool:
+    """Whether a data URI header announces percent-encoded rather than base64 data"""
+    return header.startswith("data:") and not header.endswith(";base64")
+
+
+def decoded_size(attachment: Attachment) -> int:
+    """Lower bound of the decoded size, computed from the encoded text alone"""
+    data = attachment.data
+    comma = data.find(",")
+    body = len(data) - comma - 1
+    if _is_plain(data[:comma] if comma != -1 else ""):
+        # Each %XX escape decodes to a single byte
+        return body - 2 * data.count("%", comma + 1)
+    padding = data.count("=", comma + 1)
+    whitespace = sum(data.count(char, comma + 1) for char in " \t\r\n")
+    return (body - padding - whitespace) * 3 // 4
+
+
+def check_sizes(attachments: list[Attachment]):
+    """Reject attachments whose encoded length already exceeds the size limits"""
+    total = 0
+    for attachment in attachments:
+        size = decoded_size(attachment)
+        if size > Environ.ATTACHMENT_MAX_BYTES:
+            raise AttachmentTooLarge(
+                f"Attachment '{attachment.name}' exceeds {Environ.ATTACHMENT_MAX_BYTES} bytes"
+            )
+        total += size
+    if total > Environ.ATTACHMENT_MAX_TOTAL:
+        raise AttachmentTooLarge(
+            f"Attachments exceed {Environ.ATTACHMENT_MAX_TOTAL} bytes in total"
+        )
+
+
+def parse_attachments(attachments: list[Attachment]) -> dict[str, BinaryIO]:
+    """Decode attachments into file objects, enforcing the size limits"""
+    files: dict[str, BinaryIO] = {}
+    remaining = Environ.ATTACHMENT_MAX_TOTAL
+    try:
+        for attachment in attachments:
+            limit = min(Environ.ATTACHMENT_MAX_BYTES, remaining)
+            spool = decode_attachment(attachment, limit)
+            remaining -= spool.seek(0, 2)
+            spool.seek(0)
+            files[attachment.name] = spool
+    except Exception:
+        close_attachments(files)
+        raise
+    return files
+
+
+def close_attachments(files: dict[str, BinaryIO]):
+    """Release the temporary files behind decoded attachments"""
+    for spool in files.values():
+        spool.close()
@@ -0,0 +1,144 @@
+"""Bounded in-process build queue"""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Optional
+
+from . import metrics
+from .config import Environ
+from .models import Payload
+
+
+class QueueFull(Exception):
+    """Raised when the build queue cannot admit another job"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class BuildQueue:
+    """Priority build queue that is bounded and fair across emails.
+
+    Later rounds are dispatched before earlier ones. Within a round, jobs
+    are taken round-robin across emails so one submitter cannot starve
+    the others.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Payload, Optional[str]], Awaitable[object]],
+        workers: int,
+        max_size: int,
+        max_per_email: int,
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.max_size = max_size
+        self.max_per_email = max_per_email
+        # round -> email -> pending (request, job id) pairs
+        self._buckets: dict[int, OrderedDict[str, deque[tuple[Payload, Optional[str]]]]] = {}
+        self._per_email: dict[str, int] = {}
+        self._size = 0
+        self._running = 0
+        self._avg_duration = 60.0
+        self._available = asyncio.Semaphore(0)
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def size(self) -> int:
+        """Number of queued jobs that have not started yet"""
+        return self._size
+
+    @property
+    def running(self) -> int:
+        """Number of jobs being processed by workers"""
+        return self._running
+
+    def retry_after(self) -> int:
+        """Estimate the seconds until a worker picks up the next job"""
+        return max(1, round(self._avg_duration / max(self.workers, 1)))
+
+    def submit(self, request: Payload, job_id: Optional[str] = None):
+        """Admit a job or raise QueueFull"""
+        if self._size >= self.max_size:
+            metrics.QUEUE_REJECTIONS.labels(reason="full").inc()
+            raise QueueFull("Build queue is full", self.retry_after())
+        if self._per_email.get(request.email, 0) >= self.max_per_email:
+            metrics.QUEUE_REJECTIONS.labels(reason="email").inc()
+            raise QueueFull("Too many queued builds for this email", self.retry_after())
+
+        bucket = self._buckets.setdefault(request.round_, OrderedDict())
+        bucket.setdefault(request.email, deque()).append((request, job_id))
+        self._per_email[request.email] = self._per_email.get(request.email, 0) + 1
+        self._size += 1
+        self._available.release()
+
+    def _pop(self) -> tuple[Payload, Optional[str]]:
+        """Take the next job: highest round first, round-robin across emails"""
+        round_ = max(self._buckets)
+        bucket = self._buckets[round_]
+        email, jobs = next(iter(bucket.items()))
+        job = jobs.popleft()
+        if jobs:
+            bucket.move_to_end(email)
+        else:
+            del bucket[email]
+            if not bucket:
+                del self._buckets[round_]
+
+        self._per_email[email] -= 1
+        if not self._per_email[email]:
+            del self._per_email[email]
+        self._size -= 1
+        return job
+
+    async def _worker(self):
+        """Process jobs until cancelled"""
+        while True:
+            await self._available.acquire()
+            request, job_id = self._pop()
+            self._running += 1
+            started = time.monotonic()
+            try:
+                await self.handler(request, job_id)
+            except Exception as err:
+                print(f"Build for task '{request.task}' failed: {err!r}")
+            finally:
+                self._running -= 1
+                duration = time.monotonic() - started
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+
+    def start(self):
+        """Start the worker tasks on the running event loop"""
+        self._tasks = [
+            asyncio.create_task(self._worker()) for _ in range(self.workers)
+        ]
+
+    async def stop(self):
+        """Cancel the worker tasks"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+async def run_build(request: Payload, job_id: Optional[str] = None):
+    """Run the build pipeline, importing it on first use"""
+    # The pipeline pulls in every service, which would slow down startup
+    from .helpers import process_request_async
+
+    await process_request_async(request, job_id)
+
+
+build_queue = BuildQueue(
+    run_build,
+    workers=Environ.BUILD_WORKERS,
+    max_size=Environ.BUILD_QUEUE_SIZE,
+    max_per_email=Environ.BUILD_QUEUE_PER_EMAIL,
+)
+
+QUEUE_DEPTH = metrics.Gauge(
+    "build_queue_depth", "Builds waiting for a worker.", function=lambda: build_queue.size
+)
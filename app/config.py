@@ -9,18 +9,122 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
-def get_env_variable(name: str) -> str:
-    """Get an environment variable or raise an error if not found."""
-    value = os.getenv(name)
-    if value is None:
-        print(f"Error: The environment variable '{name}' is not set.")
-        sys.exit(1)
-    return value
+# Required variables, checked by Environ.validate() when the application starts
+REQUIRED_VARIABLES = ("API_SECRET", "GITHUB_TOKEN", "AI_PIPE_API_KEY")
+
+
+def get_optional_env(name: str, default: str) -> str:
+    """Get an optional environment variable with a default value."""
+    return os.getenv(name, default)
 
 
 class Environ:
     """Environment variables required by the application."""
 
-    API_SECRET: str = get_env_variable("API_SECRET")
-    GITHUB_TOKEN: str = get_env_variable("GITHUB_TOKEN")
-    AIPIPE_API_KEY: str = get_env_variable("AI_PIPE_API_KEY")
+    # Read without failing so importing the app stays cheap, see validate()
+    API_SECRET: str = get_optional_env("API_SECRET", "")
+    GITHUB_TOKEN: str = get_optional_env("GITHUB_TOKEN", "")
+    AIPIPE_API_KEY: str = get_optional_env("AI_PIPE_API_KEY", "")
+
+    # Service endpoints, overridden to point at local stand-ins when load testing
+    AIPIPE_URL: str = get_optional_env(
+        "AIPIPE_URL", "https://aipipe.org/openai/v1/chat/completions"
+    )
+    GITHUB_API_URL: str = get_optional_env("GITHUB_API_URL", "https://api.github.com")
+    PAGES_URL_TEMPLATE: str = get_optional_env(
+        "PAGES_URL_TEMPLATE", "https://{owner}.github.io/{name}/"
+    )
+
+    # "bulk" pushes every file in one commit, "per_file" commits file by file
+    PUSH_MODE: str = get_optional_env("PUSH_MODE", "bulk")
+    PUSH_CONCURRENCY: int = int(get_optional_env("PUSH_CONCURRENCY", "8"))
+
+    # Update the existing repo in place for rounds after the first
+    INCREMENTAL_UPDATES: bool = get_optional_env("INCREMENTAL_UPDATES", "true").lower() == "true"
+
+    # Attachment limits in bytes, decoded files spill to disk past the spool size
+    ATTACHMENT_MAX_BYTES: int = int(get_optional_env("ATTACHMENT_MAX_BYTES", str(10 * 2**20)))
+    ATTACHMENT_MAX_TOTAL: int = int(get_optional_env("ATTACHMENT_MAX_TOTAL", str(25 * 2**20)))
+    ATTACHMENT_SPOOL_BYTES: int = int(get_optional_env("ATTACHMENT_SPOOL_BYTES", str(2**20)))
+
+    # Shared HTTP connection pools ("host=size" pairs, comma separated)
+    HTTP_POOL_SIZES: str = get_optional_env(
+        "HTTP_POOL_SIZES", "aipipe.org=32,api.github.com=32,github.io=32"
+    )
+    HTTP_POOL_DEFAULT: int = int(get_optional_env("HTTP_POOL_DEFAULT", "10"))
+    HTTP_KEEPALIVE: float = float(get_optional_env("HTTP_KEEPALIVE", "30"))
+    HTTP_CONNECT_TIMEOUT: float = float(get_optional_env("HTTP_CONNECT_TIMEOUT", "5"))
+    HTTP_READ_TIMEOUT: float = float(get_optional_env("HTTP_READ_TIMEOUT", "10"))
+    LLM_TIMEOUT: float = float(get_optional_env("LLM_TIMEOUT", "60"))
+
+    # LLM providers in order of preference ("name=url|model|KEY_VARIABLE" entries,
+    # comma separated), the aipipe endpoint and LLM_MODEL when empty
+    LLM_PROVIDERS: str = get_optional_env("LLM_PROVIDERS", "")
+    LLM_MODEL: str = get_optional_env("LLM_MODEL", "gpt-4.1-nano")
+    LLM_BREAKER_FAILURES: int = int(get_optional_env("LLM_BREAKER_FAILURES", "5"))
+    LLM_BREAKER_COOLDOWN: float = float(get_optional_env("LLM_BREAKER_COOLDOWN", "30"))
+    LLM_HEDGE_PERCENTILE: float = float(get_optional_env("LLM_HEDGE_PERCENTILE", "95"))
+
+    # Stream LLM output and stop as soon as the JSON object is complete
+    LLM_STREAM: bool = get_optional_env("LLM_STREAM", "true").lower() == "true"
+    LLM_STREAM_MAX_CHARS: int = int(get_optional_env("LLM_STREAM_MAX_CHARS", "200000"))
+
+    # LLM response cache, LLM_CACHE_DIR enables the on-disk store
+    LLM_CACHE_SIZE: int = int(get_optional_env("LLM_CACHE_SIZE", "128"))
+    LLM_CACHE_DIR: str = get_optional_env("LLM_CACHE_DIR", "")
+
+    # Estimated tokens shared by the attachment digests in the prompt
+    LLM_ATTACHMENT_TOKENS: int = int(get_optional_env("LLM_ATTACHMENT_TOKENS", "800"))
+
+    # Hedged generation: at most LLM_CANDIDATES calls race before the corrective
+    # retry, a backup starts every LLM_HEDGE_DELAY seconds (0 starts all at once)
+    LLM_CANDIDATES: int = int(get_optional_env("LLM_CANDIDATES", "1"))
+    LLM_HEDGE_DELAY: float = float(get_optional_env("LLM_HEDGE_DELAY", "0"))
+
+    # Number of Github GET responses kept for conditional requests
+    GITHUB_CACHE_SIZE: int = int(get_optional_env("GITHUB_CACHE_SIZE", "256"))
+
+    # Github rate limits: requests per second for all calls, per minute for
+    # content-creating ones, and how long a request may be held back
+    GITHUB_RATE: float = float(get_optional_env("GITHUB_RATE", "15"))
+    GITHUB_BURST: float = float(get_optional_env("GITHUB_BURST", "30"))
+    GITHUB_WRITE_RATE: float = float(get_optional_env("GITHUB_WRITE_RATE", "80"))
+    GITHUB_WRITE_BURST: float = float(get_optional_env("GITHUB_WRITE_BURST", "20"))
+    GITHUB_RATE_RETRIES: int = int(get_optional_env("GITHUB_RATE_RETRIES", "5"))
+    GITHUB_MAX_WAIT: float = float(get_optional_env("GITHUB_MAX_WAIT", "300"))
+
+    # Warm pool of repositories with main and Pages set up, 0 disables it
+    REPO_POOL_SIZE: int = int(get_optional_env("REPO_POOL_SIZE", "0"))
+    REPO_POOL_PREFIX: str = get_optional_env("REPO_POOL_PREFIX", "pool-")
+
+    # Github Pages readiness probing, in seconds
+    PAGES_TIMEOUT: float = float(get_optional_env("PAGES_TIMEOUT", "90"))
+    PAGES_PROBE_INTERVAL: float = float(get_optional_env("PAGES_PROBE_INTERVAL", "2"))
+    PAGES_PROBE_MAX_INTERVAL: float = float(get_optional_env("PAGES_PROBE_MAX_INTERVAL", "10"))
+    PAGES_PROBE_BATCH: int = int(get_optional_env("PAGES_PROBE_BATCH", "16"))
+
+    # Seconds between checks of prompt template files for edits
+    PROMPT_RELOAD_INTERVAL: float = float(get_optional_env("PROMPT_RELOAD_INTERVAL", "2"))
+
+    # SQLite database for the evaluation outbox and other durable state
+    STATE_DB: str = get_optional_env("STATE_DB", "state.db")
+
+    # Evaluation callback delivery, delays in seconds
+    OUTBOX_MAX_ATTEMPTS: int = int(get_optional_env("OUTBOX_MAX_ATTEMPTS", "12"))
+    OUTBOX_BASE_DELAY: float = float(get_optional_env("OUTBOX_BASE_DELAY", "1"))
+    OUTBOX_MAX_DELAY: float = float(get_optional_env("OUTBOX_MAX_DELAY", "300"))
+    OUTBOX_CONCURRENCY: int = int(get_optional_env("OUTBOX_CONCURRENCY", "8"))
+
+    # Build queue sizing
+    BUILD_WORKERS: int = int(get_optional_env("BUILD_WORKERS", "4"))
+    BUILD_QUEUE_SIZE: int = int(get_optional_env("BUILD_QUEUE_SIZE", "32"))
+    BUILD_QUEUE_PER_EMAIL: int = int(get_optional_env("BUILD_QUEUE_PER_EMAIL", "8"))
+
+    @staticmethod
+    def validate():
+        """Exit if a required variable is not set, called once at startup."""
+        missing = [name for name in REQUIRED_VARIABLES if os.getenv(name) is None]
+        for name in missing:
+            print(f"Error: The environment variable '{name}' is not set.")
+        if missing:
+            sys.exit(1)
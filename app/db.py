@@ -0,0 +1,52 @@
+"""SQLite storage shared by the durable parts of the application"""
+
+import sqlite3
+import threading
+from functools import cache
+
+from .config import Environ
+
+
+class Database:
+    """Single SQLite connection guarded by a lock"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+
+    def execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        """Run a single statement in autocommit mode"""
+        with self.lock:
+            return self.conn.execute(sql, params)
+
+    def query(self, sql: str, params: tuple = ()) -> list[sqlite3.Row]:
+        """Run a query and fetch every row"""
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def transaction(self, statements: list[tuple[str, tuple]]):
+        """Run several statements atomically"""
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                for sql, params in statements:
+                    self.conn.execute(sql, params)
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def script(self, sql: str):
+        """Run a schema script"""
+        with self.lock:
+            self.conn.executescript(sql)
+
+
+@cache
+def get_db() -> Database:
+    """Return the process-wide database"""
+    return Database(Environ.STATE_DB)
@@ -1,84 +1,202 @@
 """Helper functions"""
 
-import base64
+import asyncio
 import time
-import requests
+from contextlib import contextmanager
+from typing import Iterator, Optional
 
-from requests.exceptions import RequestException
-from github.Repository import Repository
-from .services.gh_actions import create_repo, push_code, enable_pages
-from .services.llm import generate_app
-from .models import Payload, Attachment
+from . import metrics
 
+from .config import Environ
+from .services.gh_actions import (
+    create_repo_async,
+    delete_repo_async,
+    enable_pages_async,
+    get_repo_async,
+    push_code_async,
+    update_code_async,
+)
+from .services.http import run_sync
+from .services.llm import generate_app_async
+from .attachments import close_attachments, parse_attachments
+from .jobs import jobs
+from .models import BuildContext, Payload, StageResult
+from .outbox import dispatcher, outbox
+from .pipeline import Stage, StageGraph
+from .repo_pool import repo_pool
 
-def finalize(request: Payload, repo: Repository):
-    """Send a POST request to evaluation URL with repository details."""
-    # Build data
-    owner, repo_name = repo.full_name.split("/")
+
+async def finalize_async(ctx: BuildContext):
+    """Queue the evaluation callback with repository details."""
+    # Build data from what the earlier stages recorded
+    request = ctx.request
     data = {
         "email": request.email,
         "task": request.task,
         "round": request.round_,
         "nonce": request.nonce,
-        "repo_url": f"https://github.com/{owner}/{repo_name}",
-        "commit_sha": repo.get_commits()[0].sha,
-        "pages_url": f"https://{owner}.github.io/{repo_name}/",
-    }
-    # Build header
-    headers = {
-        "Content-Type": "application/json",
+        "repo_url": ctx.repo.html_url,
+        "commit_sha": ctx.commit_sha,
+        "pages_url": ctx.pages_url,
     }
-    # Send POST requests till successful
-    delay = 1
-    while True:
-        try:
-            response = requests.post(
-                url=request.evaluation_url,
-                json=data,
-                headers=headers,
-                timeout=5,
+    # Store the callback, the outbox dispatcher delivers it with retries
+    entry_id = outbox.add(request.evaluation_url, data)
+    print(f"Queued evaluation callback {entry_id}")
+    dispatcher.notify()
+
+
+def report(ctx: BuildContext, **fields):
+    """Persist the stage progress of a job, if the build has one."""
+    if ctx.job_id:
+        stages = {name: result.model_dump() for name, result in ctx.stages.items()}
+        jobs.update(ctx.job_id, stages=stages, **fields)
+
+
+@contextmanager
+def stage(ctx: BuildContext, name: str) -> Iterator[StageResult]:
+    """Run a pipeline stage, recording it on the context, job and metrics."""
+    started = time.monotonic()
+    try:
+        with ctx.stage(name) as result:
+            report(ctx)
+            yield result
+    except asyncio.CancelledError:
+        raise
+    except BaseException:
+        metrics.STAGE_FAILURES.labels(stage=name).inc()
+        raise
+    finally:
+        metrics.STAGE_SECONDS.labels(stage=name).observe(time.monotonic() - started)
+        report(ctx)
+
+
+async def process_request_async(
+    request: Payload, job_id: Optional[str] = None
+) -> BuildContext:
+    """Process the incoming request on the event loop."""
+    ctx = BuildContext(request=request, job_id=job_id)
+    metrics.BUILDS_IN_PROGRESS.inc()
+    report(ctx, status="running", error=None)
+    try:
+        await run_pipeline(ctx)
+    except BaseException as err:
+        metrics.BUILDS.labels(outcome="failed").inc()
+        report(ctx, status="failed", error=repr(err))
+        raise
+    else:
+        metrics.BUILDS.labels(outcome="succeeded").inc()
+        result = {
+            "repo_url": ctx.repo.html_url if ctx.repo else None,
+            "commit_sha": ctx.commit_sha,
+            "pages_url": ctx.pages_url,
+            "pages_live": ctx.pages_live,
+        }
+        report(ctx, status="succeeded", result=result)
+    finally:
+        metrics.BUILDS_IN_PROGRESS.dec()
+    return ctx
+
+
+async def parse_attachments_stage(ctx: BuildContext):
+    """Decode the attachments off the event loop."""
+    ctx.attachments = await asyncio.to_thread(parse_attachments, ctx.request.attachments)
+
+
+async def close_attachments_stage(ctx: BuildContext):
+    """Release the decoded attachments."""
+    close_attachments(ctx.attachments)
+
+
+async def generate_app_stage(ctx: BuildContext):
+    """Use the LLM to generate the app from the brief and attachments."""
+    checks = "\n".join(f"- {check}" for check in ctx.request.checks)
+    ctx.llm_response = await generate_app_async(
+        ctx.request.brief, checks, ctx.attachments
+    )
+
+
+async def create_repo_stage(ctx: BuildContext):
+    """Claim or create the Github repo, later rounds update the existing one."""
+    request = ctx.request
+    if request.round_ > 1 and Environ.INCREMENTAL_UPDATES:
+        ctx.repo = await get_repo_async(request.task)
+    if ctx.repo is None:
+        ctx.repo = await repo_pool.claim(request.task)
+        ctx.repo_pooled = ctx.repo is not None
+        if ctx.repo is None:
+            ctx.repo = await create_repo_async(request.task)
+        ctx.repo_created = True
+    ctx.user = ctx.repo.owner
+    ctx.pages_url = ctx.repo.pages_url
+    verb = "updated"
+    if ctx.repo_created:
+        verb = "claimed from the pool" if ctx.repo_pooled else "created"
+    print(f"Repository '{ctx.repo.name}' {verb} at {ctx.repo.html_url}")
+
+
+async def delete_repo_stage(ctx: BuildContext):
+    """Remove a repository created for a build that never pushed code."""
+    if ctx.repo_created and ctx.commit_sha is None:
+        await delete_repo_async(ctx.repo)
+
+
+async def push_code_stage(ctx: BuildContext):
+    """Push code, committing only changed files on updates."""
+    try:
+        if ctx.repo_created:
+            # A pooled repo already has a first commit on main
+            ctx.commit_sha = await push_code_async(
+                ctx.llm_response, ctx.repo, ctx.attachments, empty=not ctx.repo_pooled
             )
-            # Break if succesful
-            if response.ok:
-                print("Posted to evaluation URL")
-                break
-            print(f"POST request failed. Retrying in {delay} seconds...")
-        except RequestException as err:
-            print(
-                f"POST request failed with {err.errno}. Retrying in {delay} seconds..."
+        else:
+            ctx.commit_sha = await update_code_async(
+                ctx.llm_response, ctx.repo, ctx.attachments
             )
+    finally:
+        close_attachments(ctx.attachments)
 
-        # Retry POST
-        time.sleep(delay)
-        delay = delay * 2 if delay < 64 else 64
 
+async def enable_pages_stage(ctx: BuildContext):
+    """Enable Github pages, reusing the site of an updated or pooled repo."""
+    existing = ctx.repo_pooled or not ctx.repo_created
+    ctx.pages_live = await enable_pages_async(
+        ctx.repo, reuse=existing, commit_sha=ctx.commit_sha if existing else None
+    )
 
-def parse_attachments(attachments: list[Attachment]) -> dict[str, bytes]:
-    """Parse attachments from the request."""
-    return {
-        a.name: base64.b64decode(a.data.split(",")[-1]) for a in attachments
-    }
+
+# Repository setup overlaps with the LLM call, which needs the attachment digests
+PIPELINE = StageGraph(
+    [
+        Stage("parse_attachments", parse_attachments_stage, undo=close_attachments_stage),
+        Stage("generate_app", generate_app_stage, after=("parse_attachments",)),
+        Stage("create_repo", create_repo_stage, undo=delete_repo_stage),
+        Stage(
+            "push_code",
+            push_code_stage,
+            after=("parse_attachments", "generate_app", "create_repo"),
+        ),
+        Stage("enable_pages", enable_pages_stage, after=("push_code",)),
+        Stage("finalize", finalize_async, after=("enable_pages",)),
+    ]
+)
 
 
-def process_request(request: Payload):
-    """Process the incoming request in the background."""
-    # 4 - Parse the attachments
-    attachments = parse_attachments(request.attachments)
+async def run_pipeline(ctx: BuildContext):
+    """Run every stage of a build, recording progress on the context."""
+    await PIPELINE.run(ctx, stage)
+    print("Process completed.")
 
-    # 4 - Use LLM to generate app
-    checks = "\n".join(f"- {check}" for check in request.checks)
-    llm_response = generate_app(request.brief, checks)
 
-    # 5 - Create Github repo
-    repo = create_repo(request.task)
-    print(f"Repository '{repo.name}' created at {repo.html_url}")
+def finalize(ctx: BuildContext):
+    """Queue the evaluation callback and attempt delivery (blocking)."""
 
-    # 5 - Push code to repo
-    push_code(llm_response, repo, attachments)
+    async def deliver():
+        await finalize_async(ctx)
+        await dispatcher.dispatch_due()
 
-    # 6 - Enable Github pages
-    enable_pages(repo)
+    run_sync(deliver())
 
-    # 7. Post to evaluation url
-    finalize(request, repo)
-    print("Process completed.")
+
+def process_request(request: Payload) -> BuildContext:
+    """Process the incoming request (blocking)."""
+    return run_sync(process_request_async(request))
@@ -0,0 +1,110 @@
+"""Persistent job store that deduplicates build submissions"""
+
+import json
+import time
+import uuid
+
+from .db import Database, get_db
+from .models import Payload
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    task TEXT NOT NULL,
+    round INTEGER NOT NULL,
+    nonce TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stages TEXT NOT NULL DEFAULT '{}',
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    UNIQUE (task, round, nonce)
+);
+"""
+
+# Jobs in these states have not finished and must not be started twice
+ACTIVE = ("queued", "running")
+
+
+class JobStore:
+    """Build jobs keyed by task, round and nonce, stored in SQLite"""
+
+    def __init__(self, db: Database):
+        self.db = db
+        self.db.script(SCHEMA)
+
+    def submit(self, request: Payload) -> tuple[str, bool]:
+        """Return the job id for a request and whether it should be queued.
+
+        A resubmission gets the existing id back. It is only queued again
+        when the earlier attempt failed, keeping that error until it runs.
+        """
+        now = time.time()
+        self.db.execute(
+            "INSERT OR IGNORE INTO jobs (id, task, round, nonce, status, created, updated) "
+            "VALUES (?, ?, ?, ?, 'new', ?, ?)",
+            (uuid.uuid4().hex, request.task, request.round_, request.nonce, now, now),
+        )
+        row = self.db.query(
+            "SELECT id, status FROM jobs WHERE task = ? AND round = ? AND nonce = ?",
+            (request.task, request.round_, request.nonce),
+        )[0]
+        if row["status"] not in ("new", "failed"):
+            return row["id"], False
+        self.update(row["id"], status="queued")
+        return row["id"], True
+
+    def discard(self, job_id: str):
+        """Undo a submission that could not be queued.
+
+        A job that submit created is forgotten. A failed job that it queued
+        again, which still carries its error, goes back to failed.
+        """
+        now = time.time()
+        self.db.transaction(
+            [
+                (
+                    "DELETE FROM jobs WHERE id = ? AND status = 'queued' AND error IS NULL",
+                    (job_id,),
+                ),
+                (
+                    "UPDATE jobs SET status = 'failed', updated = ? "
+                    "WHERE id = ? AND status = 'queued'",
+                    (now, job_id),
+                ),
+            ]
+        )
+
+    def update(self, job_id: str, **fields):
+        """Update status, stages, result or error of a job"""
+        for name in ("stages", "result"):
+            if name in fields and fields[name] is not None:
+                fields[name] = json.dumps(fields[name])
+        fields["updated"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        self.db.execute(
+            f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id)
+        )
+
+    def get(self, job_id: str) -> dict | None:
+        """Return a job as a dict, None if unknown"""
+        rows = self.db.query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        job = dict(rows[0])
+        job["stages"] = json.loads(job["stages"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def recover(self):
+        """Fail jobs left unfinished by a previous process"""
+        placeholders = ", ".join("?" for _ in ACTIVE)
+        self.db.execute(
+            f"UPDATE jobs SET status = 'failed', error = 'Interrupted by a restart', "
+            f"updated = ? WHERE status IN ({placeholders})",
+            (time.time(), *ACTIVE),
+        )
+
+
+jobs = JobStore(get_db())
@@ -0,0 +1,269 @@
+"""Prometheus metrics for the build pipeline"""
+
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable
+
+# Latency buckets in seconds, spanning quick API calls to slow Pages builds
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+def _escape(value: str) -> str:
+    """Escape a label value for the exposition format"""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    """Render a label set in the exposition format"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric(ABC):
+    """Base class for a metric family with optional labels"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self._lock = threading.Lock()
+        self._children: dict[tuple[str, ...], "Metric"] = {}
+        REGISTRY.append(self)
+
+    def labels(self, **values: str):
+        """Return the child metric for a set of label values"""
+        key = tuple(str(values[name]) for name in self.label_names)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        """Create the series for a new set of label values"""
+
+    @abstractmethod
+    def _samples(self) -> list[str]:
+        """Render the sample lines of every series"""
+
+    @property
+    def family(self) -> str:
+        """Name of the family in the HELP and TYPE lines"""
+        return self.name
+
+    def render(self) -> str:
+        """Render the family with its HELP and TYPE lines"""
+        lines = [
+            f"# HELP {self.family} {self.documentation}",
+            f"# TYPE {self.family} {self.kind}",
+        ]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _Value:
+    """A single float value"""
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def _add(self, amount: float):
+        with self._lock:
+            self.value += amount
+
+
+class _CounterValue(_Value):
+    """A value that only goes up"""
+
+    def inc(self, amount: float = 1):
+        """Increase the value"""
+        if amount < 0:
+            raise ValueError("Counters can only be increased")
+        self._add(amount)
+
+
+class _GaugeValue(_Value):
+    """A value that goes up and down"""
+
+    def inc(self, amount: float = 1):
+        """Increase the value"""
+        self._add(amount)
+
+    def dec(self, amount: float = 1):
+        """Decrease the value"""
+        self._add(-amount)
+
+    def set(self, value: float):
+        """Set the value"""
+        self.value = value
+
+
+class _SingleValueMetric(Metric):
+    """Metric family whose series each hold one value"""
+
+    def inc(self, amount: float = 1):
+        """Increase the unlabelled series"""
+        self.labels().inc(amount)
+
+    def _value_samples(self, suffix: str = "") -> list[str]:
+        return [
+            f"{self.name}{suffix}{_format_labels(self.label_names, key)} {child.value}"
+            for key, child in self._children.items()
+        ]
+
+
+class Counter(_SingleValueMetric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    @property
+    def family(self) -> str:
+        """Counter samples carry the _total suffix, so the family does too"""
+        return f"{self.name}_total"
+
+    def _new_child(self) -> _CounterValue:
+        return _CounterValue()
+
+    def _samples(self) -> list[str]:
+        return self._value_samples("_total")
+
+
+class Gauge(_SingleValueMetric):
+    """Value that can go up and down, or be read from a function"""
+
+    kind = "gauge"
+
+    def __init__(self, *args, function: Callable[[], float] | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.function = function
+
+    def _new_child(self) -> _GaugeValue:
+        return _GaugeValue()
+
+    def dec(self, amount: float = 1):
+        """Decrease the unlabelled gauge"""
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        """Set the unlabelled gauge"""
+        self.labels().set(value)
+
+    def _samples(self) -> list[str]:
+        if self.function is not None:
+            return [f"{self.name} {self.function()}"]
+        return self._value_samples()
+
+
+class _Buckets:
+    """Bucket counts, sum and count of one histogram series"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        """Record one observation"""
+        with self._lock:
+            self.counts[bisect_left(BUCKETS, value)] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Histogram(Metric):
+    """Distribution of observed values over fixed buckets"""
+
+    kind = "histogram"
+
+    def _new_child(self) -> _Buckets:
+        return _Buckets()
+
+    def observe(self, value: float):
+        """Record an observation in the unlabelled histogram"""
+        self.labels().observe(value)
+
+    def _samples(self) -> list[str]:
+        lines = []
+        for key, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip((*BUCKETS, "+Inf"), child.counts):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {child.sum}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+REGISTRY: list[Metric] = []
+
+
+def render() -> str:
+    """Render every metric in the Prometheus text format"""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+STAGE_SECONDS = Histogram(
+    "build_stage_seconds", "Duration of each build pipeline stage.", ("stage",)
+)
+STAGE_FAILURES = Counter(
+    "build_stage_failures", "Build stages that raised an error.", ("stage",)
+)
+BUILDS = Counter("builds", "Finished builds by outcome.", ("outcome",))
+BUILDS_IN_PROGRESS = Gauge("builds_in_progress", "Builds currently running.")
+QUEUE_REJECTIONS = Counter(
+    "build_queue_rejections", "Builds rejected with 429 by reason.", ("reason",)
+)
+LLM_ATTEMPT_SECONDS = Histogram(
+    "llm_attempt_seconds", "Duration of each LLM generation attempt.", ("attempt",)
+)
+LLM_ATTEMPTS = Counter(
+    "llm_attempts", "LLM generation attempts by outcome.", ("attempt", "outcome")
+)
+LLM_CHECK_FAILURES = Counter(
+    "llm_check_failures", "Generations that failed the static brief checks.", ("attempt",)
+)
+LLM_RETRIES = Counter("llm_retries", "Corrective LLM retries.")
+LLM_HEDGES = Counter("llm_hedges", "Backup LLM candidates started by reason.", ("reason",))
+LLM_PROVIDER_REQUESTS = Counter(
+    "llm_provider_requests", "LLM provider requests by outcome.", ("provider", "outcome")
+)
+LLM_PROVIDER_SECONDS = Histogram(
+    "llm_provider_seconds", "Duration of each LLM provider request.", ("provider",)
+)
+LLM_PROVIDER_HEDGES = Counter(
+    "llm_provider_hedges", "Requests moved on to the next LLM provider.", ("reason",)
+)
+LLM_PROVIDER_OPEN = Gauge(
+    "llm_provider_circuit_open", "Whether the circuit breaker of a provider is open.", ("provider",)
+)
+LLM_CACHE_HITS = Counter("llm_cache_hits", "Generations served from the cache.")
+GITHUB_THROTTLE_SECONDS = Histogram(
+    "github_throttle_seconds", "Time Github requests waited for the rate limiter.", ("lane",)
+)
+GITHUB_RATE_LIMITED = Counter(
+    "github_rate_limited",
+    "Github responses asking to back off, retried or out of retries.",
+    ("outcome",),
+)
+GITHUB_RATE_REMAINING = Gauge(
+    "github_rate_remaining", "Requests left in the Github quota, from X-RateLimit-Remaining."
+)
+REPO_POOL_AVAILABLE = Gauge("repo_pool_available", "Pooled repositories ready to be claimed.")
+REPO_POOL_CLAIMS = Counter(
+    "repo_pool_claims", "Attempts to claim a pooled repository by outcome.", ("outcome",)
+)
+PAGES_PROBES = Counter("pages_probes", "Github Pages readiness probes by result.", ("result",))
+CALLBACK_ATTEMPTS = Counter(
+    "evaluation_callback_attempts", "Evaluation callback deliveries by outcome.", ("outcome",)
+)
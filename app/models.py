@@ -1,8 +1,13 @@
 """Models for the application."""
 
-from typing import Optional
+import asyncio
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
 from pydantic import BaseModel, Field
 
+from .config import Environ
+
 
 class Attachment(BaseModel):
     """Attachmennt model for incoming requests."""
@@ -37,6 +42,68 @@ class LLMResponse(BaseModel):
     python_code: Optional[str] = Field(None, alias="main.py", title="main.py")
 
 
+class RepoInfo(BaseModel):
+    """Model for a Github repository returned by the REST API"""
+
+    name: str
+    full_name: str
+    html_url: str
+
+    @property
+    def owner(self) -> str:
+        """Login of the repository owner"""
+        return self.full_name.split("/")[0]
+
+    @property
+    def pages_url(self) -> str:
+        """URL of the Github Pages site"""
+        return Environ.PAGES_URL_TEMPLATE.format(owner=self.owner, name=self.name)
+
+
+class StageResult(BaseModel):
+    """Outcome of a single pipeline stage"""
+
+    status: str = "running"
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+class BuildContext(BaseModel):
+    """Per-job state that the pipeline stages read from and write to"""
+
+    request: Payload
+    job_id: Optional[str] = None
+    attachments: dict[str, Any] = {}
+    llm_response: Optional[LLMResponse] = None
+    user: Optional[str] = None
+    repo: Optional[RepoInfo] = None
+    repo_created: bool = False
+    repo_pooled: bool = False
+    commit_sha: Optional[str] = None
+    pages_url: Optional[str] = None
+    pages_live: Optional[bool] = None
+    stages: dict[str, StageResult] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageResult]:
+        """Record the duration and outcome of a stage"""
+        result = self.stages[name] = StageResult()
+        started = time.monotonic()
+        try:
+            yield result
+        except asyncio.CancelledError:
+            result.status = "cancelled"
+            raise
+        except BaseException as err:
+            result.status = "failed"
+            result.error = repr(err)
+            raise
+        else:
+            result.status = "done"
+        finally:
+            result.seconds = round(time.monotonic() - started, 3)
+
+
 class EvaluationData(BaseModel):
     """Model for evaluation data sent to /_eval endpoint"""
     
@@ -0,0 +1,180 @@
+"""Durable outbox for evaluation callbacks"""
+
+import asyncio
+import json
+import random
+import time
+
+from . import metrics
+from .config import Environ
+from .db import Database, get_db
+from .services.http import get_http_client
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL,
+    body TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    created REAL NOT NULL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_next_attempt ON outbox (next_attempt);
+CREATE TABLE IF NOT EXISTS dead_letter (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    body TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    created REAL NOT NULL,
+    failed_at REAL NOT NULL,
+    last_error TEXT
+);
+"""
+
+
+class Outbox:
+    """Evaluation callbacks waiting to be delivered, stored in SQLite"""
+
+    def __init__(self, db: Database):
+        self.db = db
+        self.db.script(SCHEMA)
+
+    def add(self, url: str, data: dict) -> int:
+        """Store a callback for delivery and return its id"""
+        now = time.time()
+        cursor = self.db.execute(
+            "INSERT INTO outbox (url, body, next_attempt, created) VALUES (?, ?, ?, ?)",
+            (url, json.dumps(data), now, now),
+        )
+        return cursor.lastrowid or 0
+
+    def due(self, limit: int) -> list[dict]:
+        """Return callbacks whose next attempt is due"""
+        rows = self.db.query(
+            "SELECT * FROM outbox WHERE next_attempt <= ? ORDER BY next_attempt LIMIT ?",
+            (time.time(), limit),
+        )
+        return [dict(row) for row in rows]
+
+    def next_due(self) -> float | None:
+        """Return the time of the earliest pending attempt"""
+        rows = self.db.query("SELECT MIN(next_attempt) AS next FROM outbox")
+        return rows[0]["next"] if rows else None
+
+    def delivered(self, entry_id: int):
+        """Remove a delivered callback"""
+        self.db.execute("DELETE FROM outbox WHERE id = ?", (entry_id,))
+
+    def retry(self, entry: dict, error: str, delay: float):
+        """Record a failed attempt and schedule the next one"""
+        self.db.execute(
+            "UPDATE outbox SET attempts = ?, next_attempt = ?, last_error = ? WHERE id = ?",
+            (entry["attempts"] + 1, time.time() + delay, error, entry["id"]),
+        )
+
+    def dead_letter(self, entry: dict, error: str):
+        """Move a callback that ran out of attempts to the dead-letter table"""
+        self.db.transaction(
+            [
+                (
+                    "INSERT OR REPLACE INTO dead_letter "
+                    "(id, url, body, attempts, created, failed_at, last_error) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        entry["id"],
+                        entry["url"],
+                        entry["body"],
+                        entry["attempts"] + 1,
+                        entry["created"],
+                        time.time(),
+                        error,
+                    ),
+                ),
+                ("DELETE FROM outbox WHERE id = ?", (entry["id"],)),
+            ]
+        )
+
+
+def backoff(attempts: int) -> float:
+    """Exponential backoff with full jitter"""
+    ceiling = min(Environ.OUTBOX_MAX_DELAY, Environ.OUTBOX_BASE_DELAY * 2**attempts)
+    return random.uniform(0, ceiling)
+
+
+class OutboxDispatcher:
+    """Deliver outbox entries concurrently in the background"""
+
+    def __init__(self, outbox: Outbox):
+        self.outbox = outbox
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def _deliver(self, entry: dict):
+        """Attempt one delivery and record the outcome"""
+        try:
+            response = await get_http_client(entry["url"]).post(
+                entry["url"],
+                content=entry["body"],
+                headers={"Content-Type": "application/json"},
+                timeout=5,
+            )
+            if response.is_success:
+                print("Posted to evaluation URL")
+                metrics.CALLBACK_ATTEMPTS.labels(outcome="delivered").inc()
+                self.outbox.delivered(entry["id"])
+                return
+            error = f"HTTP {response.status_code}"
+        except Exception as err:
+            # Invalid URLs raise errors outside httpx.HTTPError, count them as
+            # attempts too so they back off and end up dead-lettered
+            error = repr(err)
+
+        if entry["attempts"] + 1 >= Environ.OUTBOX_MAX_ATTEMPTS:
+            print(f"Giving up on evaluation callback {entry['id']}: {error}")
+            metrics.CALLBACK_ATTEMPTS.labels(outcome="dead_letter").inc()
+            self.outbox.dead_letter(entry, error)
+        else:
+            delay = backoff(entry["attempts"])
+            print(f"POST request failed with {error}. Retrying in {delay:.1f} seconds...")
+            metrics.CALLBACK_ATTEMPTS.labels(outcome="retry").inc()
+            self.outbox.retry(entry, error, delay)
+
+    async def dispatch_due(self):
+        """Deliver every callback that is currently due"""
+        while entries := self.outbox.due(Environ.OUTBOX_CONCURRENCY):
+            await asyncio.gather(*(self._deliver(entry) for entry in entries))
+
+    async def _run(self):
+        """Deliver callbacks as they become due"""
+        while True:
+            try:
+                await self.dispatch_due()
+            except Exception as err:
+                print(f"Outbox dispatch failed: {err!r}")
+            next_due = self.outbox.next_due()
+            sleep = 60.0 if next_due is None else max(next_due - time.time(), 0.1)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), min(sleep, 60.0))
+            except asyncio.TimeoutError:
+                pass
+
+    def notify(self):
+        """Wake the dispatcher after a new callback was added"""
+        self._wakeup.set()
+
+    def start(self):
+        """Start delivering on the running event loop"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop delivering, pending callbacks stay in the outbox"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+outbox = Outbox(get_db())
+dispatcher = OutboxDispatcher(outbox)
@@ -0,0 +1,119 @@
+"""Dependency-graph executor for the build pipeline"""
+
+import asyncio
+from contextlib import AbstractContextManager
+from typing import Awaitable, Callable, Iterable, Optional
+
+from .models import BuildContext, StageResult
+
+StageFunction = Callable[[BuildContext], Awaitable[None]]
+Recorder = Callable[[BuildContext, str], AbstractContextManager[StageResult]]
+
+
+class Stage:
+    """A pipeline step, the stages it waits for and how to undo it"""
+
+    def __init__(
+        self,
+        name: str,
+        run: StageFunction,
+        after: Iterable[str] = (),
+        undo: Optional[StageFunction] = None,
+    ):
+        self.name = name
+        self.run = run
+        self.after = tuple(after)
+        self.undo = undo
+
+
+class StageGraph:
+    """Run each stage as soon as the stages it depends on are done.
+
+    When a stage fails the running ones are cancelled and the completed
+    ones are undone in reverse order before the error is raised. Running
+    stages that can be undone are left to finish instead, since cancelling
+    them could leave behind a half-made side effect that nothing undoes.
+    """
+
+    def __init__(self, stages: Iterable[Stage]):
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in self.stages.values():
+            for dependency in stage.after:
+                if dependency not in self.stages:
+                    raise ValueError(
+                        f"Stage '{stage.name}' depends on unknown stage '{dependency}'"
+                    )
+        self.order = self._sort()
+
+    def _sort(self) -> list[str]:
+        """Return the stage names in dependency order, rejecting cycles"""
+        order: list[str] = []
+        remaining = dict(self.stages)
+        while remaining:
+            ready = [
+                name
+                for name, stage in remaining.items()
+                if all(dependency in order for dependency in stage.after)
+            ]
+            if not ready:
+                raise ValueError(f"Stages {', '.join(remaining)} form a cycle")
+            for name in ready:
+                order.append(name)
+                del remaining[name]
+        return order
+
+    async def run(self, ctx: BuildContext, record: Recorder):
+        """Execute every stage for ctx, wrapping each one in record"""
+        done: list[str] = []
+        running: dict[asyncio.Task, str] = {}
+        pending = [self.stages[name] for name in self.order]
+
+        async def execute(stage: Stage):
+            with record(ctx, stage.name):
+                await stage.run(ctx)
+
+        def launch_ready():
+            for stage in list(pending):
+                if all(dependency in done for dependency in stage.after):
+                    pending.remove(stage)
+                    running[asyncio.create_task(execute(stage))] = stage.name
+
+        try:
+            launch_ready()
+            while running:
+                finished, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                errors = []
+                for task in finished:
+                    name = running.pop(task)
+                    if task.exception() is None:
+                        done.append(name)
+                    else:
+                        errors.append(task.exception())
+                if errors:
+                    raise errors[0]
+                launch_ready()
+        except BaseException:
+            for task, name in running.items():
+                if self.stages[name].undo is None:
+                    task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            done.extend(
+                name
+                for task, name in running.items()
+                if not task.cancelled() and task.exception() is None
+            )
+            await self._undo(ctx, done)
+            raise
+
+    async def _undo(self, ctx: BuildContext, done: list[str]):
+        """Undo completed stages in reverse order, logging failures"""
+        for name in reversed(done):
+            undo = self.stages[name].undo
+            if undo is None:
+                continue
+            try:
+                await undo(ctx)
+            except Exception as err:
+                print(f"Undoing stage '{name}' failed: {err!r}")
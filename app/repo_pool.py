@@ -0,0 +1,141 @@
+"""Warm pool of repositories provisioned ahead of the builds that use them"""
+
+import asyncio
+import time
+import uuid
+from typing import Optional
+
+from . import metrics
+from .config import Environ
+from .db import Database, get_db
+from .models import RepoInfo
+from .services.gh_actions import (
+    delete_repo_async,
+    provision_repo_async,
+    rename_repo_async,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS repo_pool (
+    name TEXT PRIMARY KEY,
+    full_name TEXT NOT NULL,
+    html_url TEXT NOT NULL,
+    created REAL NOT NULL
+);
+"""
+
+# Seconds before refilling again after provisioning failed
+RETRY_DELAY = 60.0
+
+
+class RepoPool:
+    """Repositories with main and Pages already set up, stored in SQLite.
+
+    A build claims the oldest one and renames it to its task, and the
+    background worker provisions a replacement, so creating the repo and
+    enabling Pages stay off the build's critical path.
+    """
+
+    def __init__(self, db: Database, size: int, prefix: str):
+        self.db = db
+        self.size = size
+        self.prefix = prefix
+        self.db.script(SCHEMA)
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def available(self) -> int:
+        """Return the number of repositories ready to be claimed"""
+        return self.db.query("SELECT COUNT(*) AS count FROM repo_pool")[0]["count"]
+
+    def _add(self, repo: RepoInfo):
+        """Store a provisioned repository"""
+        self.db.execute(
+            "INSERT OR REPLACE INTO repo_pool (name, full_name, html_url, created) "
+            "VALUES (?, ?, ?, ?)",
+            (repo.name, repo.full_name, repo.html_url, time.time()),
+        )
+        metrics.REPO_POOL_AVAILABLE.set(self.available())
+
+    def _take(self) -> RepoInfo | None:
+        """Remove the oldest repository from the pool and return it"""
+        rows = self.db.query(
+            "DELETE FROM repo_pool WHERE name = "
+            "(SELECT name FROM repo_pool ORDER BY created LIMIT 1) "
+            "RETURNING name, full_name, html_url"
+        )
+        if not rows:
+            return None
+        metrics.REPO_POOL_AVAILABLE.set(self.available())
+        return RepoInfo.model_validate(dict(rows[0]))
+
+    async def claim(self, name: str) -> Optional[RepoInfo]:
+        """Rename a pooled repository to name, None when the pool is empty"""
+        if not self.size:
+            return None
+        repo = self._take()
+        if repo is None:
+            metrics.REPO_POOL_CLAIMS.labels(outcome="empty").inc()
+            return None
+        self.notify()
+        try:
+            claimed = await rename_repo_async(repo, name)
+        except BaseException as err:
+            # The repo is no longer tracked, so drop it rather than leak it
+            print(f"Claiming pooled repository {repo.full_name} failed: {err!r}")
+            metrics.REPO_POOL_CLAIMS.labels(outcome="failed").inc()
+            await asyncio.shield(self._discard(repo))
+            if not isinstance(err, Exception):
+                raise
+            # Fall back to creating the repository
+            return None
+        metrics.REPO_POOL_CLAIMS.labels(outcome="claimed").inc()
+        return claimed
+
+    async def _discard(self, repo: RepoInfo):
+        """Delete a repository taken from the pool that could not be claimed"""
+        try:
+            await delete_repo_async(repo)
+        except Exception as err:
+            print(f"Deleting pooled repository {repo.full_name} failed: {err!r}")
+
+    async def fill(self):
+        """Provision repositories until the pool is full"""
+        while self.available() < self.size:
+            name = f"{self.prefix}{uuid.uuid4().hex[:12]}"
+            self._add(await provision_repo_async(name))
+
+    async def _run(self):
+        """Refill the pool whenever a repository is claimed"""
+        while True:
+            timeout = None
+            try:
+                await self.fill()
+            except Exception as err:
+                print(f"Refilling the repository pool failed: {err!r}")
+                timeout = RETRY_DELAY
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def notify(self):
+        """Wake the worker after a repository was claimed"""
+        self._wakeup.set()
+
+    def start(self):
+        """Start refilling on the running event loop, if the pool is enabled"""
+        metrics.REPO_POOL_AVAILABLE.set(self.available())
+        if self.size:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop refilling, pooled repositories stay for the next start"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+repo_pool = RepoPool(get_db(), Environ.REPO_POOL_SIZE, Environ.REPO_POOL_PREFIX)
@@ -1,17 +1,19 @@
 """App routes module"""
 
-from fastapi import APIRouter, BackgroundTasks, status
+from fastapi import APIRouter, status
 from fastapi.responses import JSONResponse
 
+from .attachments import AttachmentTooLarge, check_sizes
 from .models import Payload, EvaluationData
 from .config import Environ
-from .helpers import process_request
+from .build_queue import build_queue, QueueFull
+from .jobs import jobs
 
 router = APIRouter()
 
 
 @router.post("/build")
-async def build(request: Payload, tasks: BackgroundTasks):
+async def build(request: Payload):
     """App build endpoint"""
 
     # Get and validate secret key
@@ -25,16 +27,53 @@ async def build(request: Payload, tasks: BackgroundTasks):
             status_code=status.HTTP_401_UNAUTHORIZED,
         )
 
-    # Process task in the background
-    tasks.add_task(process_request, request)
+    # Reject oversized attachments now rather than failing the build later
+    try:
+        check_sizes(request.attachments)
+    except AttachmentTooLarge as err:
+        return JSONResponse(
+            content={"message": str(err)},
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+        )
+
+    # Resubmissions of the same task, round and nonce share one job
+    job_id, new = jobs.submit(request)
+    if not new:
+        return JSONResponse(
+            content={"message": "Request already received.", "job_id": job_id},
+            status_code=status.HTTP_200_OK,
+        )
+
+    # Queue task for the build workers, shedding load when full
+    try:
+        build_queue.submit(request, job_id)
+    except QueueFull as err:
+        jobs.discard(job_id)
+        return JSONResponse(
+            content={"message": f"{err}. Retry later."},
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            headers={"Retry-After": str(err.retry_after)},
+        )
 
     # Return a JSON response confirming receipt
     return JSONResponse(
-        content={"message": "Request received. Buildling Application..."},
+        content={"message": "Request received. Buildling Application...", "job_id": job_id},
         status_code=status.HTTP_200_OK,
     )
 
 
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Build job status endpoint"""
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse(
+            content={"message": "Job not found."},
+            status_code=status.HTTP_404_NOT_FOUND,
+        )
+    return JSONResponse(content=job, status_code=status.HTTP_200_OK)
+
+
 @router.post("/_eval")
 async def evaluate(evaluation_data: EvaluationData):
     """Evaluation endpoint to receive deployment results"""
@@ -0,0 +1,376 @@
+"""Static checks of generated HTML against the request checks and brief"""
+
+import re
+from functools import lru_cache
+from html.parser import HTMLParser
+from typing import Callable, Iterable
+
+VOID_TAGS = frozenset(
+    "area base br col embed hr img input link meta source track wbr".split()
+)
+STRING = r"""(['"`])(.*?)\{q}"""
+QUERY = re.compile(
+    r"(?P<neg>!?!?)document\.querySelector(?P<all>All)?\(\s*"
+    + STRING.format(q=3)
+    + r"\s*\)(?P<tail>[^;]*)"
+)
+TITLE = re.compile(r"document\.title\s*===?\s*" + STRING.format(q=1))
+LENGTH = re.compile(r"^\s*\.length\s*(>=|<=|===|!==|==|!=|>|<)\s*(\d+)")
+TAG_NAME = re.compile(r"^\s*\.tagName\s*===?\s*" + STRING.format(q=1))
+SCRIPT_TEXT = re.compile(
+    r"^\s*\.(?:textContent|innerHTML|innerText)\.includes\(\s*" + STRING.format(q=1)
+)
+SIMPLE = re.compile(
+    r"""\#(?P<id>[\w-]+)|\.(?P<cls>[\w-]+)"""
+    r"""|\[\s*(?P<attr>[\w:-]+)\s*(?:(?P<op>[~|^$*]?=)\s*(?P<val>"[^"]*"|'[^']*'|[^\]\s]+)\s*)?\]"""
+)
+TAG = re.compile(r"[a-zA-Z][\w-]*|\*")
+BRIEF_ID = re.compile(r"(?<![\w&/])#([a-zA-Z][\w-]*)")
+HEX_COLOR = re.compile(r"[0-9a-fA-F]{3,8}")
+COMPARE = {
+    ">=": lambda a, b: a >= b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    "<": lambda a, b: a < b,
+    "===": lambda a, b: a == b,
+    "==": lambda a, b: a == b,
+    "!==": lambda a, b: a != b,
+    "!=": lambda a, b: a != b,
+}
+
+
+class Element:
+    """An element of the parsed document"""
+
+    __slots__ = ("tag", "attrs", "classes", "parent", "text")
+
+    def __init__(self, tag: str, attrs: dict[str, str], parent: int | None):
+        self.tag = tag
+        self.attrs = attrs
+        self.classes = frozenset(attrs.get("class", "").split())
+        self.parent = parent
+        self.text: list[str] = []
+
+
+class Dom(HTMLParser):
+    """Document parsed once and indexed by id, tag, script src and link href"""
+
+    def __init__(self, html: str):
+        super().__init__(convert_charrefs=True)
+        self.elements: list[Element] = []
+        self.by_id: dict[str, int] = {}
+        self.by_tag: dict[str, list[int]] = {}
+        self.script_srcs: list[str] = []
+        self.link_hrefs: list[str] = []
+        self.title = ""
+        self._open: list[int] = []
+        self.feed(html)
+        self.close()
+        self.scripts = "\n".join(
+            "".join(self.elements[index].text) for index in self.by_tag.get("script", [])
+        )
+
+    def handle_starttag(self, tag, attrs):
+        values = {name: value or "" for name, value in attrs}
+        index = len(self.elements)
+        self.elements.append(Element(tag, values, self._open[-1] if self._open else None))
+        self.by_tag.setdefault(tag, []).append(index)
+        if "id" in values:
+            self.by_id.setdefault(values["id"], index)
+        if tag == "script" and values.get("src"):
+            self.script_srcs.append(values["src"])
+        if tag == "link" and values.get("href"):
+            self.link_hrefs.append(values["href"])
+        if tag not in VOID_TAGS:
+            self._open.append(index)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self._open.pop()
+
+    def handle_endtag(self, tag):
+        for depth in range(len(self._open) - 1, -1, -1):
+            if self.elements[self._open[depth]].tag == tag:
+                del self._open[depth:]
+                break
+
+    def handle_data(self, data):
+        if not self._open:
+            return
+        element = self.elements[self._open[-1]]
+        if element.tag in ("script", "title"):
+            element.text.append(data)
+            if element.tag == "title":
+                self.title = "".join(element.text).strip()
+
+    def select(self, selector: "Selector") -> list[int]:
+        """Return the indices of matching elements in document order"""
+        matches: set[int] = set()
+        for compound_list in selector:
+            last = compound_list[-1][0]
+            if last.ident is not None:
+                index = self.by_id.get(last.ident)
+                candidates = [] if index is None else [index]
+            elif last.tag is not None:
+                candidates = self.by_tag.get(last.tag, [])
+            else:
+                candidates = range(len(self.elements))
+            matches.update(
+                index for index in candidates if self._match(index, compound_list)
+            )
+        return sorted(matches)
+
+    def _match(self, index: int, compounds: list[tuple["Compound", str]]) -> bool:
+        """Match a complex selector right to left starting at index"""
+        compound, combinator = compounds[-1]
+        if not compound.matches(self.elements[index]):
+            return False
+        if len(compounds) == 1:
+            return True
+        parent = self.elements[index].parent
+        if combinator == ">":
+            return parent is not None and self._match(parent, compounds[:-1])
+        while parent is not None:
+            if self._match(parent, compounds[:-1]):
+                return True
+            parent = self.elements[parent].parent
+        return False
+
+
+class Compound:
+    """A compound selector such as div#id.class[attr*=value]"""
+
+    def __init__(self, tag, ident, classes, attrs):
+        self.tag = tag
+        self.ident = ident
+        self.classes = classes
+        self.attrs = attrs
+
+    def matches(self, element: Element) -> bool:
+        """Check a single element against the compound"""
+        if self.tag is not None and element.tag != self.tag:
+            return False
+        if self.ident is not None and element.attrs.get("id") != self.ident:
+            return False
+        if not self.classes <= element.classes:
+            return False
+        for name, op, value in self.attrs:
+            actual = element.attrs.get(name)
+            if actual is None or not _attr_matches(actual, op, value):
+                return False
+        return True
+
+
+# A selector list: for each comma separated part, compounds with the
+# combinator that links them to the previous one
+Selector = list[list[tuple[Compound, str]]]
+
+
+def _attr_matches(actual: str, op: str | None, value: str) -> bool:
+    """Apply a CSS attribute operator"""
+    if op is None:
+        return True
+    if op == "=":
+        return actual == value
+    if op == "*=":
+        return bool(value) and value in actual
+    if op == "^=":
+        return bool(value) and actual.startswith(value)
+    if op == "$=":
+        return bool(value) and actual.endswith(value)
+    if op == "~=":
+        return value in actual.split()
+    return actual == value or actual.startswith(value + "-")
+
+
+def _parse_compound(text: str) -> Compound | None:
+    """Parse one compound selector, None if it uses unsupported syntax"""
+    tag = TAG.match(text)
+    position = tag.end() if tag else 0
+    ident, classes, attrs = None, set(), []
+    for match in SIMPLE.finditer(text, position):
+        if match.start() != position:
+            return None
+        position = match.end()
+        if match["id"]:
+            ident = match["id"]
+        elif match["cls"]:
+            classes.add(match["cls"])
+        else:
+            value = match["val"] or ""
+            if value and value[0] in "'\"":
+                value = value[1:-1]
+            attrs.append((match["attr"].lower(), match["op"], value))
+    if position != len(text) or not text:
+        return None
+    name = tag.group().lower() if tag and tag.group() != "*" else None
+    return Compound(name, ident, frozenset(classes), attrs)
+
+
+@lru_cache(maxsize=512)
+def parse_selector(text: str) -> Selector | None:
+    """Parse a CSS selector list, None if it uses unsupported syntax"""
+    selector: Selector = []
+    for part in _split(text, ","):
+        compounds: list[tuple[Compound, str]] = []
+        combinator = " "
+        for token in _split(part.replace(">", " > "), " "):
+            if token == ">":
+                combinator = ">"
+                continue
+            compound = _parse_compound(token)
+            if compound is None:
+                return None
+            compounds.append((compound, combinator))
+            combinator = " "
+        if not compounds:
+            return None
+        selector.append(compounds)
+    return selector or None
+
+
+def _split(text: str, separator: str) -> list[str]:
+    """Split outside brackets and quotes, dropping empty parts"""
+    parts, current, quote, depth = [], [], "", 0
+    for char in text:
+        if quote:
+            quote = "" if char == quote else quote
+        elif char in "'\"":
+            quote = char
+        elif char == "[":
+            depth += 1
+        elif char == "]":
+            depth -= 1
+        elif char == separator and not depth:
+            parts.append("".join(current))
+            current = []
+            continue
+        current.append(char)
+    parts.append("".join(current))
+    return [part.strip() for part in parts if part.strip()]
+
+
+Check = Callable[[Dom], str | None]
+
+
+def _exists(text: str, selector: Selector) -> Check:
+    return lambda dom: None if dom.select(selector) else f"No element matches '{text}'"
+
+
+def _count(text: str, selector: Selector, op: str, expected: int) -> Check:
+    def check(dom: Dom) -> str | None:
+        found = len(dom.select(selector))
+        if COMPARE[op](found, expected):
+            return None
+        return f"Expected {op} {expected} elements matching '{text}', found {found}"
+
+    return check
+
+
+def _tag_name(text: str, selector: Selector, expected: str) -> Check:
+    def check(dom: Dom) -> str | None:
+        found = dom.select(selector)
+        if found and dom.elements[found[0]].tag == expected.lower():
+            return None
+        return f"First element matching '{text}' is not a <{expected.lower()}>"
+
+    return check
+
+
+def _script_includes(text: str, selector: Selector, expected: str) -> Check:
+    def check(dom: Dom) -> str | None:
+        found = dom.select(selector)
+        if found and expected in "".join(dom.elements[found[0]].text):
+            return None
+        return f"First element matching '{text}' does not include {expected!r}"
+
+    return check
+
+
+def _title(expected: str) -> Check:
+    def check(dom: Dom) -> str | None:
+        # The title may also be set from a script at runtime
+        if dom.title == expected or expected in dom.scripts:
+            return None
+        return f"Missing expected title text: {expected}"
+
+    return check
+
+
+@lru_cache(maxsize=512)
+def compile_check(check: str) -> tuple[Check, ...]:
+    """Compile the statically checkable parts of a check expression.
+
+    Unsupported expressions compile to nothing, so they never fail.
+    """
+    compiled: list[Check] = []
+    if title := TITLE.search(check):
+        compiled.append(_title(title[2]))
+
+    # Negated or null-tolerant lookups may legitimately find nothing
+    if "null" in check or "?." in check:
+        return tuple(compiled)
+    for query in QUERY.finditer(check):
+        text, tail = query[4], query["tail"]
+        selector = parse_selector(text)
+        if selector is None or query["neg"] == "!":
+            continue
+        if query["all"]:
+            if length := LENGTH.match(tail):
+                compiled.append(_count(text, selector, length[1], int(length[2])))
+            continue
+        compiled.append(_exists(text, selector))
+        if tag_name := TAG_NAME.match(tail):
+            compiled.append(_tag_name(text, selector, tag_name[2]))
+        elif (includes := SCRIPT_TEXT.match(tail)) and re.match(r"^script\b", text):
+            compiled.append(_script_includes(text, selector, includes[2]))
+    return tuple(compiled)
+
+
+@lru_cache(maxsize=128)
+def compile_brief(brief: str) -> tuple[Check, ...]:
+    """Compile hints from the brief that the page must reflect"""
+    compiled: list[Check] = []
+    if "bootstrap" in brief.lower():
+        compiled.append(
+            lambda dom: None
+            if any("bootstrap" in url.lower() for url in dom.script_srcs + dom.link_hrefs)
+            else "Bootstrap reference not found in HTML"
+        )
+    if "fetch(" in brief:
+        compiled.append(
+            lambda dom: None if "fetch(" in dom.scripts else "fetch( not found in script"
+        )
+    for ident in dict.fromkeys(BRIEF_ID.findall(brief)):
+        if not HEX_COLOR.fullmatch(ident):
+            selector = parse_selector(f"#{ident}")
+            if selector is not None:
+                compiled.append(_exists(f"#{ident}", selector))
+    return tuple(compiled)
+
+
+def compile_checks(checks: Iterable[str], brief: str = "") -> list[Check]:
+    """Compile every check and the brief hints into static assertions.
+
+    Checks written as prose rather than document.* expressions are
+    scanned for the same hints as the brief.
+    """
+    compiled: list[Check] = []
+    prose: list[str] = []
+    for check in checks:
+        assertions = compile_check(check.strip())
+        compiled.extend(assertions)
+        if not assertions and "document." not in check:
+            prose.append(check.strip())
+    compiled.extend(compile_brief("\n".join([brief, *prose])))
+    return compiled
+
+
+def run_checks(html: str, compiled: list[Check]) -> list[str]:
+    """Parse html once and return the issues found by the compiled checks"""
+    if not compiled:
+        return []
+    dom = Dom(html)
+    issues = (check(dom) for check in compiled)
+    return list(dict.fromkeys(issue for issue in issues if issue))
@@ -1,81 +1,404 @@
 """Github Actions"""
 
-import time
-import requests
-from github import Github, Auth, UnknownObjectException
-from github.Repository import Repository
+import asyncio
+import base64
+import hashlib
+import json
+from functools import cache
+from typing import AsyncIterator, BinaryIO
+from urllib.parse import quote
 
 from app.config import Environ
-from app.models import LLMResponse
+from app.models import LLMResponse, RepoInfo
+from app.services.github_api import GithubClient, GithubError
+from app.services.http import run_sync
+from app.services.pages import get_scheduler
 
 
-def create_repo(name: str) -> Repository:
+@cache
+def get_client() -> GithubClient:
+    """Return the process-wide Github client for the configured token"""
+    return GithubClient(Environ.GITHUB_TOKEN, cache_size=Environ.GITHUB_CACHE_SIZE)
+
+
+# Serve Pages straight from the root of main
+PAGES_SOURCE = {"source": {"branch": "main", "path": "/"}, "build_type": "legacy"}
+
+
+async def _delete_if_exists(client: GithubClient, full_name: str):
+    """Delete a repository, a missing repo answers 404"""
+    try:
+        await client.delete(f"/repos/{full_name}")
+    except GithubError as err:
+        if err.status != 404:
+            raise
+
+
+async def create_repo_async(name: str) -> RepoInfo:
     """Create a new GitHub repository if it doesn't exist"""
     print(f"Creating repository: {name}")
-    # Authenticate to GitHub
-    token = Environ.GITHUB_TOKEN
-    auth = Auth.Token(token)
-    git = Github(auth=auth)
-    user = git.get_user()
+    client = get_client()
+    user = await client.get_user()
 
     # Delete repo if it exists
-    try:
-        repo = user.get_repo(name)
-        repo.delete()
-    except UnknownObjectException:
-        pass
+    await _delete_if_exists(client, f"{user['login']}/{name}")
 
     # Create a new repository and return it
-    repo = user.create_repo(name)  # type: ignore
+    response = await client.post("/user/repos", json={"name": name})
+    return RepoInfo.model_validate(response.json())
+
+
+async def delete_repo_async(repo: RepoInfo):
+    """Delete a repository, ignoring one that is already gone"""
+    print(f"Deleting repository: {repo.full_name}")
+    await _delete_if_exists(get_client(), repo.full_name)
+
+
+async def provision_repo_async(name: str) -> RepoInfo:
+    """Create a repository with a first commit on main and Pages enabled"""
+    print(f"Provisioning repository: {name}")
+    client = get_client()
+    response = await client.post("/user/repos", json={"name": name})
+    repo = RepoInfo.model_validate(response.json())
+    try:
+        await _init_repo(client, repo)
+        await client.post(f"/repos/{repo.full_name}/pages", json=PAGES_SOURCE)
+    except Exception:
+        await _delete_if_exists(client, repo.full_name)
+        raise
     return repo
 
 
-def push_code(
-    llm_response: LLMResponse, repo: Repository, attachments: dict[str, bytes]
-):
-    """Push code files to Github Repo"""
-    print("Pushing files to repository...")
+async def rename_repo_async(repo: RepoInfo, name: str) -> RepoInfo:
+    """Rename a repository, replacing any repository that has the new name"""
+    print(f"Renaming repository {repo.full_name} to {name}")
+    client = get_client()
+    await _delete_if_exists(client, f"{repo.owner}/{name}")
+    response = await client.patch(f"/repos/{repo.full_name}", json={"name": name})
+    return RepoInfo.model_validate(response.json())
+
+
+FileContent = str | bytes | BinaryIO
+
+# Bytes read per step when streaming a file, a multiple of 3 so every
+# chunk encodes to base64 without padding
+STREAM_CHUNK = 48 * 1024
+
+
+def collect_files(
+    llm_response: LLMResponse, attachments: dict[str, bytes | BinaryIO]
+) -> dict[str, FileContent]:
+    """Collect generated files and attachments keyed by repository path"""
+    files: dict[str, FileContent] = {}
     for field_name, field in type(llm_response).model_fields.items():
         file_content = getattr(llm_response, field_name)
         file_name = field.title if field.title else field_name
         if file_content:
-            repo.create_file(
-                file_name, f"Add {file_name}", file_content, branch="main"
+            files[file_name] = file_content
+    files.update(attachments)
+    return files
+
+
+def _b64(file_content: str | bytes) -> str:
+    """Base64 encode file content for the Github API"""
+    if isinstance(file_content, str):
+        file_content = file_content.encode("utf-8")
+    return base64.b64encode(file_content).decode("ascii")
+
+
+class _Base64Body:
+    """JSON request body that streams a file as base64.
+
+    Every iteration starts again from the top of the file, so a request
+    held back by the rate limiter can be sent again.
+    """
+
+    def __init__(self, head: bytes, fileobj: BinaryIO, tail: bytes):
+        self.head = head
+        self.fileobj = fileobj
+        self.tail = tail
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        self.fileobj.seek(0)
+        yield self.head
+        while chunk := self.fileobj.read(STREAM_CHUNK):
+            yield base64.b64encode(chunk)
+        yield self.tail
+
+
+def _json_body(fields: dict, file_content: FileContent) -> dict:
+    """Build request kwargs for a JSON body whose "content" is the file.
+
+    File objects are base64 encoded while the request is being sent, so
+    the whole file is never held in memory.
+    """
+    if not hasattr(file_content, "read"):
+        return {"json": {**fields, "content": _b64(file_content)}}
+
+    fileobj: BinaryIO = file_content  # type: ignore[assignment]
+    size = fileobj.seek(0, 2)
+    fileobj.seek(0)
+    head = json.dumps(fields)[:-1].encode() + (b', "content": "' if fields else b'"content": "')
+    tail = b'"}'
+
+    length = len(head) + 4 * ((size + 2) // 3) + len(tail)
+    return {
+        "content": _Base64Body(head, fileobj, tail),
+        "headers": {"Content-Type": "application/json", "Content-Length": str(length)},
+    }
+
+
+async def _create_file(
+    client: GithubClient, repo: RepoInfo, file_name: str, file_content: FileContent
+) -> dict:
+    """Create a file on main through the contents API and return the commit"""
+    # Keep "/" so nested paths stay paths, escape spaces, "#" and "?"
+    response = await client.put(
+        f"/repos/{repo.full_name}/contents/{quote(file_name)}",
+        **_json_body({"message": f"Add {file_name}", "branch": "main"}, file_content),
+    )
+    return response.json()["commit"]
+
+
+async def _push_per_file(
+    client: GithubClient, repo: RepoInfo, files: dict[str, FileContent]
+) -> str:
+    """Push files one commit at a time through the contents API"""
+    commit_sha = ""
+    for file_name, file_content in files.items():
+        commit = await _create_file(client, repo, file_name, file_content)
+        commit_sha = commit["sha"]
+    return commit_sha
+
+
+async def _init_repo(client: GithubClient, repo: RepoInfo) -> tuple[str, str]:
+    """Make the first commit, since the Git Data API rejects empty repos"""
+    # .nojekyll also lets Pages skip the Jekyll build
+    commit = await _create_file(client, repo, ".nojekyll", b"")
+    return commit["sha"], commit["tree"]["sha"]
+
+
+async def _head_commit(client: GithubClient, repo: RepoInfo) -> tuple[str, str]:
+    """Return the head commit and tree SHA of main, initializing an empty repo"""
+    try:
+        ref = (await client.get(f"/repos/{repo.full_name}/git/ref/heads/main")).json()
+    except GithubError as err:
+        if err.status not in (404, 409):
+            raise
+        return await _init_repo(client, repo)
+    commit_sha = ref["object"]["sha"]
+    commit = (
+        await client.get(f"/repos/{repo.full_name}/git/commits/{commit_sha}")
+    ).json()
+    return commit_sha, commit["tree"]["sha"]
+
+
+def git_blob_sha(file_content: FileContent) -> str:
+    """Compute the SHA Git assigns to a blob with this content"""
+    if isinstance(file_content, str):
+        file_content = file_content.encode("utf-8")
+    if isinstance(file_content, bytes):
+        return hashlib.sha1(b"blob %d\0%s" % (len(file_content), file_content)).hexdigest()
+
+    size = file_content.seek(0, 2)
+    file_content.seek(0)
+    digest = hashlib.sha1(b"blob %d\0" % size)
+    while chunk := file_content.read(STREAM_CHUNK):
+        digest.update(chunk)
+    file_content.seek(0)
+    return digest.hexdigest()
+
+
+async def _commit_files(
+    client: GithubClient,
+    repo: RepoInfo,
+    files: dict[str, FileContent],
+    parent_sha: str,
+    base_tree: str,
+    message: str,
+) -> str:
+    """Upload blobs, build one tree on top of base_tree and move main to it"""
+    limit = asyncio.Semaphore(Environ.PUSH_CONCURRENCY)
+
+    async def upload(file_name: str, file_content: FileContent) -> dict:
+        async with limit:
+            response = await client.post(
+                f"/repos/{repo.full_name}/git/blobs",
+                **_json_body({"encoding": "base64"}, file_content),
             )
+        return {
+            "path": file_name,
+            "mode": "100644",
+            "type": "blob",
+            "sha": response.json()["sha"],
+        }
 
-    # PUsh attachments to repository
-    for file_name, file_data in attachments.items():
-        repo.create_file(
-            file_name, f"Add {file_name}", file_data, branch="main"
+    # Blobs are independent of each other, so upload them concurrently
+    elements = await asyncio.gather(
+        *(upload(name, content) for name, content in files.items())
+    )
+
+    tree = (
+        await client.post(
+            f"/repos/{repo.full_name}/git/trees",
+            json={"base_tree": base_tree, "tree": elements},
+        )
+    ).json()
+    commit = (
+        await client.post(
+            f"/repos/{repo.full_name}/git/commits",
+            json={
+                "message": message,
+                "tree": tree["sha"],
+                "parents": [parent_sha],
+            },
         )
+    ).json()
+    await client.patch(
+        f"/repos/{repo.full_name}/git/refs/heads/main", json={"sha": commit["sha"]}
+    )
+    return commit["sha"]
 
 
-def enable_pages(repo: Repository):
-    """Enable Github Pages for the repository"""
-    # Push a request to enable Github Pages
-    owner, repo_name = repo.full_name.split("/")
-    url = f"https://api.github.com/repos/{owner}/{repo_name}/pages"
-    headers = {
-        "Authorization": f"Bearer {Environ.GITHUB_TOKEN}",
-        "Accept": "application/vnd.github+json",
+async def _push_bulk(
+    client: GithubClient, repo: RepoInfo, files: dict[str, FileContent], empty: bool
+) -> str:
+    """Push all files in a single commit through the Git Data API"""
+    if empty:
+        parent_sha, base_tree = await _init_repo(client, repo)
+    else:
+        parent_sha, base_tree = await _head_commit(client, repo)
+    message = "Add " + ", ".join(files)
+    return await _commit_files(client, repo, files, parent_sha, base_tree, message)
+
+
+async def get_repo_async(name: str) -> RepoInfo | None:
+    """Return an existing repository of the authenticated user, if any"""
+    client = get_client()
+    user = await client.get_user()
+    try:
+        response = await client.get(f"/repos/{user['login']}/{name}")
+    except GithubError as err:
+        if err.status != 404:
+            raise
+        return None
+    return RepoInfo.model_validate(response.json())
+
+
+async def update_code_async(
+    llm_response: LLMResponse,
+    repo: RepoInfo,
+    attachments: dict[str, bytes | BinaryIO],
+) -> str:
+    """Commit only the files that differ from main and return the head SHA.
+
+    Files already in the repository but absent from this round are kept.
+    """
+    print("Updating files in repository...")
+    client = get_client()
+    files = collect_files(llm_response, attachments)
+    try:
+        parent_sha, base_tree = await _head_commit(client, repo)
+    except GithubError as err:
+        if err.status != 404:
+            raise
+        return await _push_bulk(client, repo, files, empty=True)
+
+    tree = (
+        await client.get(
+            f"/repos/{repo.full_name}/git/trees/{base_tree}",
+            params={"recursive": 1},
+        )
+    ).json()
+    current = {item["path"]: item["sha"] for item in tree["tree"] if item["type"] == "blob"}
+    changed = {
+        name: content
+        for name, content in files.items()
+        if current.get(name) != git_blob_sha(content)
     }
-    data = {"source": {"branch": "main", "path": "/"}, "build_type": "legacy"}
-    response = requests.post(url, json=data, headers=headers, timeout=10)
+    if not changed:
+        print("Repository is already up to date")
+        return parent_sha
 
-    # Check status code
-    if response.status_code == 201:
-        print("Github pages enabled")
-    else:
-        print(response.json())
-
-    # Check if pages is live
-    iter_count = 0
-    pages_url = f"https://{owner}.github.io/{repo_name}/"
-    while not requests.get(pages_url, timeout=5).ok:
-        time.sleep(3)
-        if iter_count > 30:
-            print("Timed out waiting for Github Pages")
-            break
-        iter_count += 1
+    message = "Update " + ", ".join(changed)
+    return await _commit_files(client, repo, changed, parent_sha, base_tree, message)
+
+
+async def push_code_async(
+    llm_response: LLMResponse,
+    repo: RepoInfo,
+    attachments: dict[str, bytes | BinaryIO],
+    mode: str | None = None,
+    empty: bool = False,
+) -> str:
+    """Push code files to Github Repo and return the commit SHA.
+
+    Pass empty=True for a repository known to have no commits yet, which
+    saves looking up the head of main.
+    """
+    print("Pushing files to repository...")
+    client = get_client()
+    files = collect_files(llm_response, attachments)
+    mode = mode or Environ.PUSH_MODE
+    if mode == "per_file":
+        return await _push_per_file(client, repo, files)
+    return await _push_bulk(client, repo, files, empty)
+
+
+async def _pages_enabled(client: GithubClient, repo: RepoInfo) -> bool:
+    """Check whether Github Pages is already configured for the repository"""
+    try:
+        await client.get(f"/repos/{repo.full_name}/pages")
+    except GithubError as err:
+        if err.status != 404:
+            raise
+        return False
+    return True
+
+
+async def enable_pages_async(
+    repo: RepoInfo, reuse: bool = False, commit_sha: str | None = None
+) -> bool:
+    """Enable Github Pages for the repository and report if it went live.
+
+    With reuse=True an existing Pages site is kept as is. With commit_sha
+    the wait lasts until Pages has built that commit.
+    """
+    client = get_client()
+    if not (reuse and await _pages_enabled(client, repo)):
+        # Push a request to enable Github Pages
+        try:
+            await client.post(f"/repos/{repo.full_name}/pages", json=PAGES_SOURCE)
+            print("Github pages enabled")
+        except GithubError as err:
+            print(err)
+
+    # Wait for the shared scheduler to report the site as live
+    live = await get_scheduler(client).wait(repo, commit_sha)
+    if live:
+        print(f"Github Pages is live at {repo.pages_url}")
     else:
-        print(f"Github Pages is live at {pages_url}")
+        print("Timed out waiting for Github Pages")
+    return live
+
+
+def create_repo(name: str) -> RepoInfo:
+    """Create a new GitHub repository (blocking)"""
+    return run_sync(create_repo_async(name))
+
+
+def push_code(
+    llm_response: LLMResponse,
+    repo: RepoInfo,
+    attachments: dict[str, bytes | BinaryIO],
+    mode: str | None = None,
+) -> str:
+    """Push code files to Github Repo (blocking)"""
+    return run_sync(push_code_async(llm_response, repo, attachments, mode))
+
+
+def enable_pages(
+    repo: RepoInfo, reuse: bool = False, commit_sha: str | None = None
+) -> bool:
+    """Enable Github Pages for the repository (blocking)"""
+    return run_sync(enable_pages_async(repo, reuse, commit_sha))
@@ -0,0 +1,201 @@
+"""Async client for the Github REST API"""
+
+import asyncio
+import time
+from collections import OrderedDict
+
+import httpx
+
+from app import metrics
+from app.config import Environ
+from app.services.http import get_http_client
+
+API_URL = Environ.GITHUB_API_URL
+
+
+class GithubError(Exception):
+    """Error response returned by the Github REST API"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Github API error {status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class TokenBucket:
+    """Token bucket where a request that finds it empty books a later slot.
+
+    Tokens can go negative, each waiter sleeping until its own token has
+    been refilled, so requests leave in the order they arrived. Nothing
+    is bound to an event loop, so one bucket serves every loop.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Take a token and return the seconds to wait for it"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self):
+        """Give back a reserved token that was not used"""
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class RateLimiter:
+    """Pace all Github traffic of the process within the API rate limits.
+
+    Every request takes a token from the general bucket. Content-creating
+    requests (anything but GET) also take one from a slower bucket that
+    follows Github's secondary limit on them. When Github reports the
+    quota as spent or asks to back off, everything waits until then.
+    """
+
+    def __init__(self):
+        self.general = TokenBucket(Environ.GITHUB_RATE, Environ.GITHUB_BURST)
+        self.writes = TokenBucket(Environ.GITHUB_WRITE_RATE / 60, Environ.GITHUB_WRITE_BURST)
+        self.paused_until = 0.0
+
+    async def acquire(self, method: str):
+        """Wait for a slot to send a request"""
+        lane = "read" if method in ("GET", "HEAD") else "write"
+        buckets = [self.general, self.writes] if lane == "write" else [self.general]
+        delay = max(bucket.reserve() for bucket in buckets)
+        delay = max(delay, self.paused_until - time.monotonic())
+        if delay <= 0:
+            return
+        if delay > Environ.GITHUB_MAX_WAIT:
+            # Failing fast must not push back the requests queued after this one
+            for bucket in buckets:
+                bucket.refund()
+            raise GithubError(429, f"Rate limited for another {delay:.0f} seconds")
+        metrics.GITHUB_THROTTLE_SECONDS.labels(lane=lane).observe(delay)
+        await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        """Hold every request for the given number of seconds"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def update(self, response: httpx.Response) -> float | None:
+        """Read the rate-limit headers, return the wait before a retry if limited"""
+        headers = response.headers
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        if remaining is not None:
+            metrics.GITHUB_RATE_REMAINING.set(int(remaining))
+        until_reset = max(int(reset) - time.time(), 1) if reset else 60.0
+
+        wait = None
+        if response.status_code in (403, 429):
+            if "Retry-After" in headers:
+                wait = float(headers["Retry-After"])
+            elif remaining == "0":
+                wait = until_reset
+            elif "rate limit" in response.text.lower():
+                # Secondary limits without Retry-After ask for at least a minute
+                wait = 60.0
+        if wait is not None:
+            self.pause(wait)
+        elif remaining == "0":
+            # This request spent the quota, hold the next ones until the reset
+            self.pause(until_reset)
+        return wait
+
+
+class GithubClient:
+    """Minimal async Github REST client authenticated with a token.
+
+    GET responses carrying an ETag are cached and revalidated with
+    If-None-Match. Github does not count 304 responses against the rate
+    limit, so repeated reads are cheap in both latency and quota.
+    """
+
+    def __init__(self, token: str, base_url: str = API_URL, cache_size: int = 256):
+        self.base_url = base_url
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, tuple[str, httpx.Response]] = OrderedDict()
+        self._user: dict | None = None
+        self.limiter = RateLimiter()
+        self.headers = {
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/vnd.github+json",
+            "X-GitHub-Api-Version": "2022-11-28",
+        }
+
+    async def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Send a request within the rate limits and raise GithubError on an error status.
+
+        A request that Github rejects for rate limiting waits as asked and is
+        sent again, up to GITHUB_RATE_RETRIES times.
+        """
+        client = get_http_client(self.base_url)
+        url = httpx.URL(self.base_url + path, params=kwargs.pop("params", None))
+        headers = {**self.headers, **kwargs.pop("headers", {})}
+        cached = self._cache.get(str(url)) if method == "GET" else None
+        if cached:
+            headers["If-None-Match"] = cached[0]
+
+        for retry in range(Environ.GITHUB_RATE_RETRIES + 1):
+            await self.limiter.acquire(method)
+            response = await client.request(method, url, headers=headers, **kwargs)
+            wait = self.limiter.update(response)
+            if wait is None:
+                break
+            if retry == Environ.GITHUB_RATE_RETRIES:
+                metrics.GITHUB_RATE_LIMITED.labels(outcome="exhausted").inc()
+                break
+            metrics.GITHUB_RATE_LIMITED.labels(outcome="retried").inc()
+            print(f"Github rate limit hit, retrying {method} {path} in {wait:.0f} seconds")
+
+        if response.status_code == 304 and cached:
+            self._cache.move_to_end(str(url))
+            return cached[1]
+        if method == "GET" and response.is_success and "ETag" in response.headers:
+            self._store(str(url), response.headers["ETag"], response)
+        if response.status_code >= 400:
+            try:
+                message = response.json().get("message", response.text)
+            except ValueError:
+                message = response.text
+            raise GithubError(response.status_code, message[:200])
+        return response
+
+    def _store(self, url: str, etag: str, response: httpx.Response):
+        """Cache a GET response under its ETag, evicting the oldest entry"""
+        self._cache[url] = (etag, response)
+        self._cache.move_to_end(url)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def get_user(self) -> dict:
+        """Return the authenticated user, fetched once per client"""
+        if self._user is None:
+            self._user = (await self.get("/user")).json()
+        return self._user
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        """Send a GET request"""
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        """Send a POST request"""
+        return await self.request("POST", path, **kwargs)
+
+    async def put(self, path: str, **kwargs) -> httpx.Response:
+        """Send a PUT request"""
+        return await self.request("PUT", path, **kwargs)
+
+    async def patch(self, path: str, **kwargs) -> httpx.Response:
+        """Send a PATCH request"""
+        return await self.request("PATCH", path, **kwargs)
+
+    async def delete(self, path: str, **kwargs) -> httpx.Response:
+        """Send a DELETE request"""
+        return await self.request("DELETE", path, **kwargs)
@@ -0,0 +1,65 @@
+"""Shared keep-alive HTTP connection pools"""
+
+import asyncio
+import weakref
+from typing import Awaitable, TypeVar
+
+import httpx
+
+from app.config import Environ
+
+T = TypeVar("T")
+
+# One set of clients per event loop, since httpx clients are bound to the
+# loop they first ran on. Keyed by host so every host gets its own pool.
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, httpx.AsyncClient]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def pool_size(host: str) -> int:
+    """Return the configured connection pool size for a host"""
+    for entry in Environ.HTTP_POOL_SIZES.split(","):
+        name, _, size = entry.strip().partition("=")
+        if name and size and (host == name or host.endswith("." + name)):
+            return int(size)
+    return Environ.HTTP_POOL_DEFAULT
+
+
+def get_http_client(url: str) -> httpx.AsyncClient:
+    """Return the pooled client for the host of url"""
+    host = httpx.URL(url).host
+    clients = _clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(host)
+    if client is None or client.is_closed:
+        size = pool_size(host)
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=size,
+                max_keepalive_connections=size,
+                keepalive_expiry=Environ.HTTP_KEEPALIVE,
+            ),
+            timeout=httpx.Timeout(
+                Environ.HTTP_READ_TIMEOUT, connect=Environ.HTTP_CONNECT_TIMEOUT
+            ),
+        )
+        clients[host] = client
+    return client
+
+
+async def close_http_clients():
+    """Close the pooled clients of the running event loop"""
+    clients = _clients.pop(asyncio.get_running_loop(), {})
+    await asyncio.gather(*(client.aclose() for client in clients.values()))
+
+
+def run_sync(coro: Awaitable[T]) -> T:
+    """Run a coroutine to completion and release its connection pools"""
+
+    async def runner() -> T:
+        try:
+            return await coro
+        finally:
+            await close_http_clients()
+
+    return asyncio.run(runner())
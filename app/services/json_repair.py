@@ -0,0 +1,148 @@
+"""Single-pass extraction and repair of JSON objects in LLM output"""
+
+import json
+import re
+
+VALID_ESCAPES = '"\\/bfnrtu'
+# Runs of characters that need no attention, skipped in one step
+PLAIN_OUTSIDE = re.compile(r'[^"\\{}\[\],]+')
+PLAIN_INSIDE = re.compile(r'[^"\\\x00-\x1f]+')
+CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+
+def _skip_preamble(text: str, repairs: list[str]) -> int:
+    """Return the index of the opening brace, noting fences and prose"""
+    start = text.find("{")
+    if start == -1:
+        raise ValueError("No JSON object found in response")
+    lead = text[:start].strip()
+    if lead.startswith("```"):
+        repairs.append("stripped code fence")
+    elif lead:
+        repairs.append("skipped text before object")
+    return start
+
+
+def _close_string(out: list[str], begin: int, real_newline: bool) -> bool:
+    """Undo double escaping in a string that never uses a real newline"""
+    if real_newline:
+        return False
+    value = "".join(out[begin:])
+    if "\\\\n" not in value:
+        return False
+    out[begin:] = [value.replace("\\\\n", "\\n").replace("\\\\t", "\\t")]
+    return True
+
+
+def repair_json(content: str) -> tuple[str, list[str]]:
+    """Extract the first JSON object and repair common LLM mistakes.
+
+    Makes one linear pass that tracks string literals, so braces inside
+    strings never affect nesting. Returns the repaired text and the list
+    of repairs that were applied.
+    """
+    repairs: list[str] = []
+    pos = _skip_preamble(content, repairs)
+    end = len(content)
+    out: list[str] = []
+    depth = 0
+    in_string = False
+    string_start = 0
+    real_newline = False
+    pending_comma = False
+    escaped_key = False
+    applied = set(repairs)
+
+    def note(repair: str):
+        if repair not in applied:
+            applied.add(repair)
+            repairs.append(repair)
+
+    while pos < end:
+        if in_string:
+            match = PLAIN_INSIDE.match(content, pos)
+            if match:
+                out.append(match.group())
+                pos = match.end()
+                continue
+            char = content[pos]
+            if char == '"':
+                out.append(char)
+                in_string = escaped_key = False
+                if _close_string(out, string_start, real_newline):
+                    note("fixed double-escaped newlines")
+            elif char == "\\":
+                nxt = content[pos + 1] if pos + 1 < end else ""
+                if escaped_key and nxt == '"':
+                    out.append(nxt)
+                    in_string = escaped_key = False
+                    pos += 1
+                elif nxt and nxt in VALID_ESCAPES:
+                    out.append(char + nxt)
+                    real_newline = real_newline or nxt == "n"
+                    pos += 1
+                else:
+                    out.append("\\\\")
+                    note("fixed invalid escape")
+            else:
+                out.append(CONTROL_ESCAPES.get(char, f"\\u{ord(char):04x}"))
+                real_newline = real_newline or char == "\n"
+                note("escaped control character")
+            pos += 1
+            continue
+
+        match = PLAIN_OUTSIDE.match(content, pos)
+        if match:
+            chunk = match.group()
+            if pending_comma and chunk.strip():
+                out.append(",")
+                pending_comma = False
+            out.append(chunk)
+            pos = match.end()
+            continue
+
+        char = content[pos]
+        if char in "}]":
+            if pending_comma:
+                note("removed trailing comma")
+            pending_comma = False
+        elif pending_comma:
+            out.append(",")
+            pending_comma = False
+
+        if char == '"':
+            out.append(char)
+            in_string = True
+            string_start = len(out)
+            real_newline = False
+            # Only the string right after the backslash is an escaped name
+            escaped_key = escaped_key and content[pos - 1] == "\\"
+        elif char == ",":
+            pending_comma = True
+        elif char == "\\":
+            # Escaped quotes around property names, e.g. {\"README.md\": ...}
+            escaped_key = content[pos + 1 : pos + 2] == '"'
+            note("unescaped property name")
+        elif char in "{[":
+            out.append(char)
+            depth += 1
+        else:
+            out.append(char)
+            depth -= 1
+            if depth == 0:
+                pos += 1
+                break
+        pos += 1
+
+    tail = content[pos:].strip().strip("`").strip()
+    if tail:
+        note("dropped text after object")
+    elif content[pos:].strip():
+        note("stripped code fence")
+    return "".join(out), repairs
+
+
+def extract_json(content: str) -> tuple[dict, list[str]]:
+    """Extract, repair and parse the first JSON object in content"""
+    text, repairs = repair_json(content)
+    return json.loads(text), repairs
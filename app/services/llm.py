@@ -1,219 +1,224 @@
 """Service to interact with LLMs via aipipe (no mock fallback)"""
 
 from pathlib import Path
-import requests
+from typing import BinaryIO
+import asyncio
 import json
-import re
+import time
 
+from app import metrics
 from app.models import LLMResponse
 from app.config import Environ
+from app.services.checks import compile_checks, run_checks
+from app.services.http import run_sync
+from app.services.json_repair import extract_json
+from app.services.llm_cache import LLMCache, cache_key
+from app.services.prompt_builder import PromptBuilder
+from app.services.llm_providers import complete, load_providers
+from app.services.llm_stream import INDEX_KEYS, StreamAborted
+from app.services.templates import TemplateRegistry
+
+providers = load_providers(Environ.LLM_PROVIDERS)
+
+prompts = TemplateRegistry(
+    Path(__file__).parent / "prompts", check_interval=Environ.PROMPT_RELOAD_INTERVAL
+)
+
+
+cache = LLMCache(Environ.LLM_CACHE_SIZE, Environ.LLM_CACHE_DIR)
+
+builder = PromptBuilder(prompts, Environ.LLM_ATTACHMENT_TOKENS)
 
 
 def load_prompt(template: str) -> str:
     """Load a prompt from template file"""
-    template_path = Path(__file__).parent / "prompts" / template
-    with open(template_path, "r", encoding="utf-8") as tf:
-        return tf.read()
+    return prompts.get(template).text
+
+
+def parse_content(content: str) -> LLMResponse:
+    """Clean the LLM output and normalize it to an LLMResponse"""
+    try:
+        parsed_json, repairs = extract_json(content)
+    except json.JSONDecodeError as je:
+        print(f"JSON decode error: {str(je)}")
+        print(f"Raw content causing error: {repr(content[:200])}")
+        raise je
+    if repairs:
+        print(f"Repaired LLM JSON: {', '.join(repairs)}")
+
+    # Normalize keys from common alternatives to required ones
+    def pick(d: dict, keys: list[str]) -> str | None:
+        for k in keys:
+            for existing in list(d.keys()):
+                if existing.lower() == k.lower():
+                    return d.pop(existing)
+        return None
+
+    normalized: dict[str, str] = {}
+    tmp = dict(parsed_json)
+    readme = pick(tmp, ["README.md", "readme.md", "readme"]) or "# App\n\nGenerated by LLM."
+    license_txt = pick(tmp, ["LICENSE", "license"]) or "MIT License"
+    index_html = pick(tmp, list(INDEX_KEYS)) or "<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>App</title></head><body><h1>App</h1></body></html>"
+    normalized["README.md"] = readme
+    normalized["LICENSE"] = license_txt
+    normalized["index.html"] = index_html
+
+    # Then validate with pydantic model
+    try:
+        return LLMResponse.model_validate(normalized)
+    except Exception as ve:
+        print(f"Validation error: {str(ve)}")
+        raise ve
+
+
+def static_brief_checks(html: str, checks_text: str, brief_text: str) -> list[str]:
+    """Evaluate the compiled request checks and brief hints against the HTML."""
+    checks = [line.strip().removeprefix("- ") for line in checks_text.splitlines()]
+    return run_checks(html, compile_checks(checks, brief_text))
+
+
+async def call_once(messages: list[dict], api_key: str) -> LLMResponse:
+    """Call the providers once with given messages and parse/normalize to LLMResponse"""
+    content = await complete(providers, messages, api_key)
+    return parse_content(content)
+
+
+async def attempt(messages: list[dict], api_key: str, number: int) -> LLMResponse:
+    """Make one generation attempt and record its latency and outcome"""
+    label = str(number)
+    outcome = "error"
+    started = time.monotonic()
+    try:
+        result = await call_once(messages, api_key)
+        outcome = "parsed"
+        return result
+    except StreamAborted:
+        outcome = "aborted"
+        raise
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    finally:
+        metrics.LLM_ATTEMPT_SECONDS.labels(attempt=label).observe(time.monotonic() - started)
+        metrics.LLM_ATTEMPTS.labels(attempt=label, outcome=outcome).inc()
+
 
+async def first_passing(
+    messages: list[dict], api_key: str, brief: str, checks: str
+) -> tuple[LLMResponse | None, list[str]]:
+    """Race up to LLM_CANDIDATES generations and keep the first that passes.
 
-def generate_app(brief: str, checks: str) -> LLMResponse:
+    A backup candidate starts every LLM_HEDGE_DELAY seconds, or right away
+    when a running one fails. Returns the passing response, or the issues
+    of the first candidate that failed the checks.
+    """
+    limit = max(Environ.LLM_CANDIDATES, 1)
+    running: set[asyncio.Task] = set()
+    started = 0
+    last_start = 0.0
+    issues: list[str] | None = None
+    errors: list[Exception] = []
+
+    def launch(reason: str | None = None):
+        nonlocal started, last_start
+        if reason:
+            metrics.LLM_HEDGES.labels(reason=reason).inc()
+        started += 1
+        last_start = time.monotonic()
+        running.add(asyncio.create_task(attempt(messages, api_key, 1)))
+
+    launch()
+    while Environ.LLM_HEDGE_DELAY <= 0 and started < limit:
+        launch("parallel")
+
+    try:
+        while running:
+            timeout = None
+            if started < limit:
+                timeout = max(last_start + Environ.LLM_HEDGE_DELAY - time.monotonic(), 0)
+            done, _ = await asyncio.wait(
+                running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                launch("delay")
+                continue
+
+            for task in done:
+                running.discard(task)
+                try:
+                    result = task.result()
+                except StreamAborted as err:
+                    # A malformed stream is cut short and corrected like a failed check
+                    print(f"Aborted LLM stream: {err}")
+                    failed = [str(err)]
+                except Exception as err:
+                    print(f"LLM candidate failed: {err!r}")
+                    errors.append(err)
+                    failed = None
+                else:
+                    failed = static_brief_checks(result.html_code, checks, brief)
+                    if not failed:
+                        return result, []
+                    metrics.LLM_CHECK_FAILURES.labels(attempt="1").inc()
+                if issues is None and failed:
+                    issues = failed
+                if started < limit:
+                    launch("failure")
+    finally:
+        # The first passing candidate wins, the others are not needed
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+    if issues is None:
+        raise errors[0]
+    return None, issues
+
+
+async def generate_app_async(
+    brief: str, checks: str, attachments: dict[str, BinaryIO] | None = None
+) -> LLMResponse:
     """Generate an app based on brief using aipipe API"""
-    
+
     # Get the aipipe API key
     api_key = Environ.AIPIPE_API_KEY
     if not api_key:
         raise RuntimeError("AIPIPE_API_KEY is not set. Cannot generate app without a valid API key.")
-    
-    try:
-        # Query the aipipe API
-        print("Querying aipipe LLM...")
-        
-        instructions = load_prompt("instructions.txt").replace("{checks}", checks)
-        user_input = load_prompt("input.txt").replace("{brief}", brief)
-        
-        # Helper to call API once with given messages and parse/normalize to LLMResponse
-        def call_once(messages: list[dict]) -> LLMResponse:
-            payload = {
-                "model": "gpt-4.1-nano",
-                "messages": messages,
-            }
-        
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            }
-        
-            # Make the API request to aipipe
-            response = requests.post(
-                "https://aipipe.org/openai/v1/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=60
-            )
 
-            if response.status_code == 200:
-                try:
-                    response_data = response.json()
-                except json.JSONDecodeError as jde:
-                    print(f"Failed to parse aipipe response as JSON: {jde}")
-                    print(f"Raw response text: {response.text[:1000]}")
-                    raise jde
-                
-                # Handle different possible response structures
-                content = None
-                if "choices" in response_data and len(response_data["choices"]) > 0:
-                    if "message" in response_data["choices"][0]:
-                        content = response_data["choices"][0]["message"]["content"]
-                    elif "text" in response_data["choices"][0]:
-                        content = response_data["choices"][0]["text"]
-                elif "content" in response_data:
-                    content = response_data["content"]
-                elif "text" in response_data:
-                    content = response_data["text"]
-                
-                if content is None:
-                    raise KeyError("No content found in aipipe response")
-                
-                # Clean and validate JSON content
-                try:
-                    # Try to extract JSON from the response (in case there's extra text)
-                    content = content.strip()
-                    
-                    # Remove common LLM artifacts
-                    if content.startswith('```json'):
-                        content = content[7:]
-                    if content.startswith('```'):
-                        content = content[3:]
-                    if content.endswith('```'):
-                        content = content[:-3]
-                    
-                    content = content.strip()
-                    
-                    # Extract JSON object - find matching braces
-                    if not content.startswith('{'):
-                        start_idx = content.find('{')
-                        if start_idx == -1:
-                            raise ValueError("No JSON object found in response")
-                        content = content[start_idx:]
-                    
-                    # Find the matching closing brace for the first opening brace
-                    brace_count = 0
-                    end_idx = -1
-                    for i, char in enumerate(content):
-                        if char == '{':
-                            brace_count += 1
-                        elif char == '}':
-                            brace_count -= 1
-                            if brace_count == 0:
-                                end_idx = i
-                                break
-                    
-                    if end_idx != -1:
-                        content = content[:end_idx + 1]
-                    
-                    # Attempt to fix common JSON issues
-                    # Fix escaped property names (common LLM error)
-                    content = re.sub(r'\\("[\w.-]+"):', r'\1:', content)
-                    
-                    # Fix double-escaped newlines (\\\\n -> \\n)
-                    content = re.sub(r'\\\\\\\\n', r'\\\\n', content)
-                    
-                    # Fix other double escaping issues
-                    content = re.sub(r'\\\\\\\\', r'\\\\', content)
-                    
-                    # Remove trailing commas before } or ]
-                    content = re.sub(r',(\s*[}\]])', r'\1', content)
-                    
-                    # Fix invalid escape sequences like \a, \b, etc (except valid ones like \n, \t, \r, \\, \")
-                    content = re.sub(r'\\([^ntr"\\\/bfuU])', r'\\\\\\1', content)
-                    
-                    print(f"Cleaned JSON content: {content[:200]}...")
-                    
-                    # First validate it's proper JSON
-                    parsed_json = json.loads(content)
-                    
-                    # Normalize keys from common alternatives to required ones
-                    def pick(d: dict, keys: list[str]) -> str | None:
-                        for k in keys:
-                            for existing in list(d.keys()):
-                                if existing.lower() == k.lower():
-                                    return d.pop(existing)
-                        return None
-                    
-                    normalized: dict[str, str] = {}
-                    tmp = dict(parsed_json)
-                    readme = pick(tmp, ["README.md", "readme.md", "readme"]) or "# App\n\nGenerated by LLM."
-                    license_txt = pick(tmp, ["LICENSE", "license"]) or "MIT License"
-                    index_html = pick(tmp, ["index.html", "index", "index_html", "html"]) or "<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>App</title></head><body><h1>App</h1></body></html>"
-                    normalized["README.md"] = readme
-                    normalized["LICENSE"] = license_txt
-                    normalized["index.html"] = index_html
-                    
-                    # Fix literal \n characters in the actual content after JSON parsing
-                    for key, value in normalized.items():
-                        if isinstance(value, str):
-                            # Convert literal \n to actual newlines in the content
-                            normalized[key] = value.replace('\\n', '\n').replace('\\t', '\t')
-                    
-                    # Then validate with pydantic model
-                    return LLMResponse.model_validate(normalized)
-                    
-                except json.JSONDecodeError as je:
-                    print(f"JSON decode error: {str(je)}")
-                    print(f"Raw content causing error: {repr(content[:200])}")
-                    raise je
-                except Exception as ve:
-                    print(f"Validation error: {str(ve)}")
-                    raise ve
-            else:
-                # Include a short prefix of the response text for debugging
-                snippet = response.text[:200].replace("\n", " ")
-                raise RuntimeError(f"aipipe API failed with status {response.status_code}: {snippet}")
-
-        def static_brief_checks(html: str, checks_text: str, brief_text: str) -> list[str]:
-            """Heuristic static checks derived from checks/brief to catch obvious mismatches."""
-            issues: list[str] = []
-            # Title check: look for document.title expected string
-            m = re.search(r"document\.title\s*===\s*[`\"]([^`\"]+)[`\"]", checks_text)
-            if m:
-                expected = m.group(1)
-                if expected not in html:
-                    issues.append(f"Missing expected title text: {expected}")
-            # Bootstrap check
-            if "bootstrap" in checks_text.lower() or "bootstrap" in brief_text.lower():
-                if "bootstrap" not in html.lower():
-                    issues.append("Bootstrap reference not found in HTML")
-            # total-sales id check
-            if "#total-sales" in checks_text or "#total-sales" in brief_text:
-                if "id=\"total-sales\"" not in html and "#total-sales" not in html:
-                    issues.append("#total-sales element not found")
-            # fetch usage hint
-            if "fetch(" in checks_text or "fetch(" in brief_text:
-                if "fetch(" not in html:
-                    issues.append("fetch( not found in script")
-            return issues
-
-        # First attempt
-        base_messages = [
-            {"role": "system", "content": instructions},
-            {"role": "user", "content": user_input},
-        ]
-        result = call_once(base_messages)
-        issues = static_brief_checks(result.html_code, checks, brief)
-        if not issues:
-            return result
-
-        # Retry once with corrective instruction
-        correction = (
-            "Your previous JSON did not satisfy these checks: \n- "
-            + "\n- ".join(issues)
-            + "\nRegenerate strictly following the brief and checks. Return ONLY JSON with keys README.md, LICENSE, index.html."
-        )
-        retry_messages = base_messages + [{"role": "user", "content": correction}]
-        result_retry = call_once(retry_messages)
-        # Accept the second attempt as final
-        return result_retry
-            
-    except Exception as e:
-        # Surface the error to the caller. Background task will log this.
-        raise
+    base_messages = builder.build(brief, checks, attachments)
+
+    # Reuse a previous generation for the same inputs
+    models = ",".join(provider.model for provider in providers)
+    key = cache_key(models, *(message["content"] for message in base_messages))
+    cached = cache.get(key)
+    if cached is not None:
+        print("Using cached LLM response")
+        metrics.LLM_CACHE_HITS.inc()
+        return cached
+
+    # Query the aipipe API
+    print("Querying aipipe LLM...")
+
+    # First attempt, hedged across candidates when configured
+    result, issues = await first_passing(base_messages, api_key, brief, checks)
+    if result is not None:
+        cache.put(key, result)
+        return result
+
+    # Retry once with a short corrective turn after the unchanged prompt
+    metrics.LLM_RETRIES.inc()
+    retry_messages = builder.retry(base_messages, issues)
+    # Accept the second attempt as final, but only cache it if it passes
+    result_retry = await attempt(retry_messages, api_key, 2)
+    if not static_brief_checks(result_retry.html_code, checks, brief):
+        cache.put(key, result_retry)
+    else:
+        metrics.LLM_CHECK_FAILURES.labels(attempt="2").inc()
+    return result_retry
+
+
+def generate_app(
+    brief: str, checks: str, attachments: dict[str, BinaryIO] | None = None
+) -> LLMResponse:
+    """Generate an app based on brief using aipipe API (blocking)"""
+    return run_sync(generate_app_async(brief, checks, attachments))
@@ -0,0 +1,70 @@
+"""Content-addressed cache of LLM responses"""
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+from app.models import LLMResponse
+
+
+def cache_key(*parts: str) -> str:
+    """Hash the inputs that determine a generation"""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part.encode("utf-8")
+        # Length prefix keeps ("ab", "c") and ("a", "bc") apart
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class LLMCache:
+    """In-memory LRU of LLM responses, optionally backed by a directory"""
+
+    def __init__(self, max_entries: int, directory: str = ""):
+        self.max_entries = max_entries
+        self.directory = Path(directory) if directory else None
+        self._entries: OrderedDict[str, LLMResponse] = OrderedDict()
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _remember(self, key: str, response: LLMResponse):
+        """Insert into the LRU layer, evicting the least recently used"""
+        self._entries[key] = response
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> LLMResponse | None:
+        """Look a response up in memory, then on disk"""
+        response = self._entries.get(key)
+        if response is not None:
+            self._entries.move_to_end(key)
+            return response
+        if not self.directory:
+            return None
+
+        path = self.directory / f"{key}.json"
+        try:
+            with open(path, "r", encoding="utf-8") as cf:
+                response = LLMResponse.model_validate(json.load(cf))
+        except FileNotFoundError:
+            return None
+        except ValueError as err:
+            print(f"Ignoring corrupt LLM cache entry {path.name}: {err}")
+            return None
+        self._remember(key, response)
+        return response
+
+    def put(self, key: str, response: LLMResponse):
+        """Store a response in memory and on disk"""
+        self._remember(key, response)
+        if not self.directory:
+            return
+        path = self.directory / f"{key}.json"
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as cf:
+            json.dump(response.model_dump(by_alias=True), cf)
+        os.replace(tmp_path, path)
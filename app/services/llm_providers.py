@@ -0,0 +1,244 @@
+"""OpenAI-compatible LLM providers with failover, hedging and circuit breakers"""
+
+import asyncio
+import json
+import os
+import time
+from collections import deque
+
+from app import metrics
+from app.config import Environ
+from app.services.http import get_http_client
+from app.services.llm_stream import StreamAborted, stream_content
+
+# Latency samples kept per provider, and needed before the percentile is trusted
+LATENCY_WINDOW = 50
+MIN_SAMPLES = 5
+
+
+class ProvidersUnavailable(RuntimeError):
+    """Raised when every provider's circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Stop calling a provider after repeated failures, then probe it again.
+
+    After LLM_BREAKER_FAILURES consecutive failures the breaker opens for
+    LLM_BREAKER_COOLDOWN seconds. It then lets a single trial request
+    through, which closes it on success or reopens it on failure.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trial = False
+
+    @property
+    def state(self) -> str:
+        """closed, open or half-open"""
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= Environ.LLM_BREAKER_COOLDOWN:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Reserve a request, False while the breaker is open"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.trial:
+            self.trial = True
+            return True
+        return False
+
+    def success(self):
+        """Close the breaker"""
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        metrics.LLM_PROVIDER_OPEN.labels(provider=self.name).set(0)
+
+    def failure(self):
+        """Count a failure, opening the breaker past the threshold"""
+        self.failures += 1
+        self.trial = False
+        if self.opened_at is not None or self.failures >= Environ.LLM_BREAKER_FAILURES:
+            if self.opened_at is None:
+                print(f"Circuit breaker opened for LLM provider '{self.name}'")
+            self.opened_at = time.monotonic()
+            metrics.LLM_PROVIDER_OPEN.labels(provider=self.name).set(1)
+
+
+class Provider:
+    """An OpenAI-compatible chat completions endpoint and model"""
+
+    def __init__(self, name: str, url: str, model: str, api_key: str | None = None):
+        self.name = name
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+        self.breaker = CircuitBreaker(name)
+        self.latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def hedge_after(self) -> float:
+        """Seconds to wait on this provider before hedging to the next one"""
+        if len(self.latencies) < MIN_SAMPLES:
+            # Too few samples for a percentile, hedge only when very slow
+            return Environ.LLM_TIMEOUT / 2
+        ordered = sorted(self.latencies)
+        rank = round(Environ.LLM_HEDGE_PERCENTILE / 100 * (len(ordered) - 1))
+        return ordered[rank]
+
+    async def complete(self, messages: list[dict], api_key: str) -> str:
+        """Request a completion and return the message content"""
+        payload = {"model": self.model, "messages": messages}
+        headers = {
+            "Authorization": f"Bearer {self.api_key or api_key}",
+            "Content-Type": "application/json",
+        }
+        client = get_http_client(self.url)
+        if Environ.LLM_STREAM:
+            return await stream_content(
+                client,
+                self.url,
+                headers,
+                payload,
+                Environ.LLM_TIMEOUT,
+                Environ.LLM_STREAM_MAX_CHARS,
+            )
+
+        response = await client.post(
+            self.url, headers=headers, json=payload, timeout=Environ.LLM_TIMEOUT
+        )
+        if response.status_code == 200:
+            try:
+                response_data = response.json()
+            except json.JSONDecodeError as jde:
+                print(f"Failed to parse {self.name} response as JSON: {jde}")
+                print(f"Raw response text: {response.text[:1000]}")
+                raise jde
+            return extract_content(response_data)
+
+        # Include a short prefix of the response text for debugging
+        snippet = response.text[:200].replace("\n", " ")
+        raise RuntimeError(
+            f"{self.name} API failed with status {response.status_code}: {snippet}"
+        )
+
+    async def tracked(self, messages: list[dict], api_key: str) -> str:
+        """Complete while feeding the breaker, latency window and metrics"""
+        outcome = "error"
+        started = time.monotonic()
+        try:
+            content = await self.complete(messages, api_key)
+            outcome = "ok"
+            self.latencies.append(time.monotonic() - started)
+            self.breaker.success()
+            return content
+        except StreamAborted:
+            # The provider answered, the model output was the problem
+            outcome = "aborted"
+            self.breaker.success()
+            raise
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            # A cancelled trial must not keep a half-open breaker reserved
+            self.breaker.trial = False
+            raise
+        except Exception:
+            self.breaker.failure()
+            raise
+        finally:
+            seconds = time.monotonic() - started
+            metrics.LLM_PROVIDER_SECONDS.labels(provider=self.name).observe(seconds)
+            metrics.LLM_PROVIDER_REQUESTS.labels(provider=self.name, outcome=outcome).inc()
+
+
+def extract_content(response_data: dict) -> str:
+    """Extract the message content from a chat completions response"""
+    # Handle different possible response structures
+    content = None
+    if "choices" in response_data and len(response_data["choices"]) > 0:
+        if "message" in response_data["choices"][0]:
+            content = response_data["choices"][0]["message"]["content"]
+        elif "text" in response_data["choices"][0]:
+            content = response_data["choices"][0]["text"]
+    elif "content" in response_data:
+        content = response_data["content"]
+    elif "text" in response_data:
+        content = response_data["text"]
+
+    if content is None:
+        raise KeyError("No content found in LLM response")
+    return content
+
+
+def load_providers(spec: str) -> list[Provider]:
+    """Parse "name=url|model|KEY_VARIABLE" entries, comma separated.
+
+    The model defaults to LLM_MODEL and the key variable to the aipipe key.
+    Without entries the single aipipe provider is used.
+    """
+    providers = []
+    for entry in spec.split(","):
+        name, _, rest = entry.strip().partition("=")
+        if not name or not rest:
+            continue
+        url, model, key_name = (rest.split("|") + ["", ""])[:3]
+        api_key = os.getenv(key_name) if key_name else None
+        providers.append(Provider(name, url, model or Environ.LLM_MODEL, api_key))
+    return providers or [Provider("aipipe", Environ.AIPIPE_URL, Environ.LLM_MODEL)]
+
+
+async def complete(providers: list[Provider], messages: list[dict], api_key: str) -> str:
+    """Return the first completion from the providers, in order of preference.
+
+    A request moves on to the next provider when the current one fails, or
+    hedges to it when the current one runs past its latency percentile.
+    Providers with an open circuit breaker are skipped.
+    """
+    queue = list(providers)
+    running: dict[asyncio.Task, Provider] = {}
+    errors: list[Exception] = []
+    deadline: float | None = None
+
+    def launch(reason: str | None = None) -> bool:
+        nonlocal deadline
+        while queue:
+            provider = queue.pop(0)
+            if provider.breaker.allow():
+                if reason:
+                    metrics.LLM_PROVIDER_HEDGES.labels(reason=reason).inc()
+                running[asyncio.create_task(provider.tracked(messages, api_key))] = provider
+                deadline = time.monotonic() + provider.hedge_after()
+                return True
+        return False
+
+    if not launch():
+        raise ProvidersUnavailable("Every LLM provider's circuit breaker is open")
+    try:
+        while running:
+            timeout = max(deadline - time.monotonic(), 0) if queue else None
+            done, _ = await asyncio.wait(
+                running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                if not launch("latency"):
+                    deadline = None
+                continue
+            for task in done:
+                provider = running.pop(task)
+                if task.exception() is None:
+                    return task.result()
+                print(f"LLM provider '{provider.name}' failed: {task.exception()!r}")
+                errors.append(task.exception())
+            # Fail over once nothing is left running
+            if not running and not launch("failure"):
+                raise errors[0]
+    finally:
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+    raise ProvidersUnavailable("No LLM provider answered")
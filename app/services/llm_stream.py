@@ -0,0 +1,153 @@
+"""Streaming chat completions with incremental JSON scanning"""
+
+import json
+
+import httpx
+
+# Keys accepted by parse_content for the generated page
+INDEX_KEYS = ("index.html", "index", "index_html", "html")
+# The other keys the response may carry, an unknown key before the index means
+# the model is not following the schema
+OTHER_KEYS = ("readme.md", "readme", "license", "script.js", "main.py")
+FENCE = "```json"
+
+
+class StreamAborted(Exception):
+    """Raised when a streamed generation is clearly malformed"""
+
+
+class JsonObjectScanner:
+    """Scan streamed text for the first top-level JSON object.
+
+    The scanner is string-aware, so braces inside string values do not
+    affect nesting. It aborts as soon as the output cannot become a valid
+    app: prose before the opening brace, an oversized body, a top-level
+    key outside the schema before index.html, or an object that closes
+    without an index.html key.
+    """
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.prefix = ""
+        self.chunks: list[str] = []
+        self.size = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.expect_key = False
+        self.key: list[str] | None = None
+        self.keys: list[str] = []
+        self.has_index = False
+
+    def _scan_prefix(self, text: str) -> str | None:
+        """Consume text before the opening brace, return the rest"""
+        start = text.find("{")
+        self.prefix += text if start == -1 else text[:start]
+        lead = self.prefix.strip().lower()
+        # Only whitespace and an optional ```json fence may precede the object
+        if lead and not (FENCE.startswith(lead) or lead == "```"):
+            raise StreamAborted(f"Prose before the JSON object: {lead[:60]!r}")
+        if len(self.prefix) > 64:
+            raise StreamAborted("No JSON object at the start of the response")
+        return None if start == -1 else text[start:]
+
+    def feed(self, text: str) -> str | None:
+        """Feed a chunk and return the object text once it is complete"""
+        if self.depth == 0:
+            rest = self._scan_prefix(text)
+            if rest is None:
+                return None
+            text = rest
+
+        for i, char in enumerate(text):
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.key is not None:
+                        self._add_key("".join(self.key))
+                        self.key = None
+                    continue
+                if self.key is not None:
+                    self.key.append(char)
+            elif char == '"':
+                self.in_string = True
+                if self.depth == 1 and self.expect_key:
+                    self.key = []
+            elif char in "{[":
+                self.depth += 1
+                self.expect_key = char == "{" and self.depth == 1
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.chunks.append(text[: i + 1])
+                    return self._finish()
+            elif self.depth == 1 and char == ",":
+                self.expect_key = True
+            elif self.depth == 1 and char == ":":
+                self.expect_key = False
+
+        self.chunks.append(text)
+        self.size += len(text)
+        if self.size > self.max_chars:
+            raise StreamAborted(f"Response exceeded {self.max_chars} characters")
+        return None
+
+    def _add_key(self, key: str):
+        """Record a top-level key, aborting on one the app cannot use"""
+        self.keys.append(key)
+        if key.lower() in INDEX_KEYS:
+            self.has_index = True
+        elif not self.has_index and key.lower() not in OTHER_KEYS:
+            raise StreamAborted(f"Unexpected key {key!r} before index.html: {self.keys}")
+
+    def _finish(self) -> str:
+        """Validate the top-level keys of the completed object"""
+        if not self.has_index:
+            raise StreamAborted(f"JSON object has no index.html key: {self.keys}")
+        return "".join(self.chunks)
+
+
+async def stream_content(
+    client: httpx.AsyncClient,
+    url: str,
+    headers: dict,
+    payload: dict,
+    timeout: float,
+    max_chars: int,
+) -> str:
+    """Stream a chat completion and return the JSON object once it closes"""
+    scanner = JsonObjectScanner(max_chars)
+    payload = {**payload, "stream": True}
+    async with client.stream(
+        "POST", url, headers=headers, json=payload, timeout=timeout
+    ) as response:
+        if response.status_code != 200:
+            snippet = (await response.aread())[:200].decode(errors="replace")
+            raise RuntimeError(
+                f"aipipe API failed with status {response.status_code}: {snippet}"
+            )
+
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data)
+            except json.JSONDecodeError as err:
+                # A broken event is a provider fault, not bad model output
+                raise RuntimeError(f"Malformed stream event: {data[:60]!r}") from err
+            choices = chunk.get("choices") or [{}]
+            delta = choices[0].get("delta", {}).get("content")
+            if delta:
+                # Leaving the context closes the stream as soon as we are done
+                content = scanner.feed(delta)
+                if content is not None:
+                    return content
+
+    raise StreamAborted("Stream ended before the JSON object was complete")
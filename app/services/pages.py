@@ -0,0 +1,142 @@
+"""Shared scheduler that waits for Github Pages sites to go live"""
+
+import asyncio
+import time
+import weakref
+
+import httpx
+
+from app import metrics
+from app.config import Environ
+from app.models import RepoInfo
+from app.services.github_api import GithubClient, GithubError
+from app.services.http import get_http_client
+
+
+class PendingSite:
+    """A Pages site that a build is waiting on"""
+
+    def __init__(
+        self,
+        repo: RepoInfo,
+        commit_sha: str | None,
+        future: asyncio.Future,
+        deadline: float,
+    ):
+        self.repo = repo
+        self.commit_sha = commit_sha
+        self.future = future
+        self.deadline = deadline
+        self.delay = Environ.PAGES_PROBE_INTERVAL
+        self.next_probe = time.monotonic() + self.delay
+
+    @property
+    def url(self) -> str:
+        """Public URL of the Pages site"""
+        return self.repo.pages_url
+
+
+class PagesScheduler:
+    """Probe every pending Pages site from a single background task.
+
+    Each site is first checked through the Pages build-status API and
+    only fetched once Github reports the build as done. Probes back off
+    per site and at most PAGES_PROBE_BATCH of them run at a time.
+    """
+
+    def __init__(self, client: GithubClient):
+        self.client = client
+        self._pending: list[PendingSite] = []
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def wait(self, repo: RepoInfo, commit_sha: str | None = None) -> bool:
+        """Wait until the site of repo is live, False on timeout or error.
+
+        With commit_sha the site only counts as live once Pages has built
+        that commit, which matters when updating an existing site.
+        """
+        future = asyncio.get_running_loop().create_future()
+        deadline = time.monotonic() + Environ.PAGES_TIMEOUT
+        self._pending.append(PendingSite(repo, commit_sha, future, deadline))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+        return await future
+
+    async def _probe(self, site: PendingSite) -> bool | None:
+        """Return True when live, False when failed, None when not yet"""
+        try:
+            build = (
+                await self.client.get(f"/repos/{site.repo.full_name}/pages/builds/latest")
+            ).json()
+            if build.get("status") == "errored":
+                print(f"Github Pages build failed for {site.repo.full_name}")
+                return False
+            if build.get("status") != "built":
+                return None
+            if site.commit_sha and build.get("commit") != site.commit_sha:
+                return None
+        except GithubError as err:
+            # No build recorded yet, fall back to probing the site itself
+            if err.status != 404:
+                print(err)
+
+        try:
+            response = await get_http_client(site.url).get(site.url, timeout=5)
+        except httpx.HTTPError:
+            return None
+        return True if response.is_success else None
+
+    def _settle(self, site: PendingSite, live: bool | None):
+        """Resolve a finished site or schedule its next probe"""
+        now = time.monotonic()
+        if live is None and now < site.deadline:
+            site.delay = min(site.delay * 1.5, Environ.PAGES_PROBE_MAX_INTERVAL)
+            site.next_probe = min(now + site.delay, site.deadline)
+            return
+        self._pending.remove(site)
+        if not site.future.done():
+            site.future.set_result(bool(live))
+
+    async def _run(self):
+        """Probe due sites in batches until nothing is pending"""
+        while self._pending:
+            now = time.monotonic()
+            due = sorted(
+                (site for site in self._pending if site.next_probe <= now),
+                key=lambda site: site.next_probe,
+            )[: Environ.PAGES_PROBE_BATCH]
+            results = await asyncio.gather(
+                *(self._probe(site) for site in due), return_exceptions=True
+            )
+            for site, live in zip(due, results):
+                # A failed probe counts as not live yet
+                if isinstance(live, Exception):
+                    live = None
+                result = {True: "live", False: "failed", None: "pending"}[live]
+                metrics.PAGES_PROBES.labels(result=result).inc()
+                self._settle(site, live)
+
+            if not self._pending:
+                break
+            sleep = min(site.next_probe for site in self._pending) - time.monotonic()
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(sleep, 0.05))
+            except asyncio.TimeoutError:
+                pass
+
+
+_schedulers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, PagesScheduler]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_scheduler(client: GithubClient) -> PagesScheduler:
+    """Return the Pages scheduler of the running event loop"""
+    loop = asyncio.get_running_loop()
+    scheduler = _schedulers.get(loop)
+    if scheduler is None:
+        scheduler = _schedulers[loop] = PagesScheduler(client)
+    return scheduler
@@ -0,0 +1,132 @@
+"""Token-aware assembly of the app generation prompt"""
+
+import math
+from pathlib import Path
+from typing import BinaryIO
+
+from app.services.templates import TemplateRegistry
+
+# Rough characters per token for English text and code, avoids a tokenizer
+CHARS_PER_TOKEN = 4
+# Bytes read from each attachment to build its digest
+SAMPLE_BYTES = 16 * 1024
+TABLE_SUFFIXES = {".csv": "CSV", ".tsv": "TSV"}
+# The retry turn names at most this many issues, each cut to ISSUE_CHARS
+MAX_ISSUES = 5
+ISSUE_CHARS = 200
+
+
+def count_tokens(text: str) -> int:
+    """Estimate the number of tokens in text"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _fit(lines: list[str], budget: int) -> list[str]:
+    """Keep leading lines while they fit in the token budget"""
+    kept, used = [], 0
+    for line in lines:
+        used += count_tokens(line) + 1
+        if used > budget:
+            break
+        kept.append(line)
+    return kept
+
+
+def _count_lines(fileobj: BinaryIO) -> int:
+    """Count the lines of a file without loading it at once"""
+    lines, last = 0, b"\n"
+    while chunk := fileobj.read(SAMPLE_BYTES):
+        lines += chunk.count(b"\n")
+        last = chunk[-1:]
+    fileobj.seek(0)
+    return lines + (last != b"\n")
+
+
+def digest_attachment(name: str, fileobj: BinaryIO, budget: int) -> str:
+    """Describe an attachment in at most budget tokens.
+
+    Tables keep their header and leading sample rows, other text files
+    their first lines, binary files only their size.
+    """
+    size = fileobj.seek(0, 2)
+    fileobj.seek(0)
+    head = fileobj.read(SAMPLE_BYTES)
+    fileobj.seek(0)
+    if b"\0" in head:
+        return f"### {name} ({size} bytes, binary, not shown)"
+
+    lines = head.decode("utf-8", errors="replace").splitlines()
+    if size > len(head) and lines:
+        # The last sampled line may be cut short
+        lines.pop()
+    kind = TABLE_SUFFIXES.get(Path(name).suffix.lower())
+    if kind:
+        rows = max(_count_lines(fileobj) - 1, 0)
+        title = f"### {name} ({kind}, {rows} data rows, header and first rows shown)"
+    else:
+        title = f"### {name} ({size} bytes, first lines shown)"
+
+    shown = _fit(lines, budget - count_tokens(title) - 2)
+    if not shown:
+        return f"### {name} ({size} bytes, too large to show)"
+    more = "\n..." if len(shown) < len(lines) or size > len(head) else ""
+    return f"{title}\n```\n" + "\n".join(shown) + f"{more}\n```"
+
+
+def digest_attachments(attachments: dict[str, BinaryIO], budget: int) -> str:
+    """Digest every attachment, sharing the token budget between them"""
+    if not attachments:
+        return "None."
+    share = budget // len(attachments)
+    return "\n\n".join(
+        digest_attachment(name, fileobj, share) for name, fileobj in attachments.items()
+    )
+
+
+class PromptBuilder:
+    """Build generation messages with a byte-stable system prefix.
+
+    The system message never depends on the request, so provider-side
+    prompt caching can reuse it, and the corrective retry only appends a
+    short turn after the unchanged first two messages.
+    """
+
+    def __init__(self, templates: TemplateRegistry, attachment_budget: int):
+        self.templates = templates
+        self.attachment_budget = attachment_budget
+
+    def build(
+        self, brief: str, checks: str, attachments: dict[str, BinaryIO] | None = None
+    ) -> list[dict]:
+        """Return the system and user messages for a generation"""
+        digest = digest_attachments(attachments or {}, self.attachment_budget)
+        system = self.templates.render("instructions.txt")
+        user = self.templates.render(
+            "input.txt", brief=brief, checks=checks, attachments=digest
+        )
+        sections = {
+            "system": count_tokens(system),
+            "brief": count_tokens(brief),
+            "checks": count_tokens(checks),
+            "attachments": count_tokens(digest),
+        }
+        sections["template"] = count_tokens(user) - sum(
+            sections[name] for name in ("brief", "checks", "attachments")
+        )
+        print(
+            "Prompt tokens (estimated): "
+            + ", ".join(f"{name}={tokens}" for name, tokens in sections.items())
+        )
+        return [
+            {"role": "system", "content": system},
+            {"role": "user", "content": user},
+        ]
+
+    def retry(self, messages: list[dict], issues: list[str]) -> list[dict]:
+        """Append a compact corrective turn to the original messages"""
+        shown = [issue[:ISSUE_CHARS] for issue in issues[:MAX_ISSUES]]
+        if len(issues) > len(shown):
+            shown.append(f"...and {len(issues) - len(shown)} more")
+        correction = "Your JSON failed these checks:\n- " + "\n- ".join(shown)
+        correction += "\nReturn the corrected JSON object only."
+        return messages + [{"role": "user", "content": correction}]
@@ -0,0 +1,82 @@
+"""Precompiled prompt templates with hot reload"""
+
+import os
+import re
+import time
+from pathlib import Path
+
+PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+
+class TemplateError(KeyError):
+    """Raised when a template is rendered without a value for a placeholder"""
+
+
+class PromptTemplate:
+    """Prompt template compiled into literal chunks and placeholder slots"""
+
+    def __init__(self, path: Path, text: str, mtime: float):
+        self.path = path
+        self.text = text
+        self.mtime = mtime
+        # Even indexes hold literal text, odd indexes hold placeholder names
+        self._parts = PLACEHOLDER.split(text)
+        self.placeholders = frozenset(self._parts[1::2])
+
+    def render(self, **values: str) -> str:
+        """Fill the placeholders in a single pass.
+
+        Raises TemplateError for a placeholder without a value, so literal
+        braces never reach the LLM.
+        """
+        missing = self.placeholders - values.keys()
+        unused = values.keys() - self.placeholders
+        if missing:
+            raise TemplateError(
+                f"Template {self.path.name} has unfilled placeholders: {sorted(missing)}"
+            )
+        if unused:
+            print(f"Template {self.path.name} has no placeholders for: {sorted(unused)}")
+
+        parts = self._parts.copy()
+        for i in range(1, len(parts), 2):
+            parts[i] = values[parts[i]]
+        return "".join(parts)
+
+
+class TemplateRegistry:
+    """Load templates once and reload them only when the file changes"""
+
+    def __init__(self, directory: Path, check_interval: float = 2.0):
+        self.directory = directory
+        self.check_interval = check_interval
+        self._templates: dict[str, PromptTemplate] = {}
+        self._checked: dict[str, float] = {}
+
+    def _load(self, name: str, mtime: float) -> PromptTemplate:
+        """Read and compile a template file"""
+        path = self.directory / name
+        with open(path, "r", encoding="utf-8") as tf:
+            template = PromptTemplate(path, tf.read(), mtime)
+        self._templates[name] = template
+        return template
+
+    def get(self, name: str) -> PromptTemplate:
+        """Return a compiled template, reloading it if its mtime changed"""
+        template = self._templates.get(name)
+        now = time.monotonic()
+        # Avoid a stat call on every request, the file rarely changes
+        if template and now - self._checked.get(name, 0) < self.check_interval:
+            return template
+
+        self._checked[name] = now
+        mtime = os.stat(self.directory / name).st_mtime
+        if template is None or template.mtime != mtime:
+            if template:
+                print(f"Reloading prompt template {name}")
+            template = self._load(name, mtime)
+        return template
+
+    def render(self, name: str, **values: str) -> str:
+        """Render a template by name"""
+        return self.get(name).render(**values)
@@ -0,0 +1,72 @@
+"""Background warm-up that loads the services after the server is up"""
+
+import asyncio
+import importlib
+import time
+
+# Modules behind the build pipeline and background workers, kept out of startup
+SERVICE_MODULES = ("app.helpers", "app.outbox", "app.repo_pool")
+
+
+class Warmup:
+    """Import the service modules off the event loop, then start their workers.
+
+    The server answers requests while this runs, and /ready reports the
+    state so a scale-to-zero host can hold traffic until it is done.
+    """
+
+    def __init__(self):
+        self.status = "starting"
+        self.error: str | None = None
+        self.seconds: float | None = None
+        self.workers: list = []
+        self._task: asyncio.Task | None = None
+
+    @property
+    def ready(self) -> bool:
+        """Whether every service is loaded and running"""
+        return self.status == "ready"
+
+    async def _run(self):
+        """Load the services and start the outbox dispatcher and repository pool"""
+        started = time.monotonic()
+        self.status = "warming"
+        try:
+            for name in SERVICE_MODULES:
+                await asyncio.to_thread(importlib.import_module, name)
+            from .outbox import dispatcher
+            from .repo_pool import repo_pool
+
+            for worker in (dispatcher, repo_pool):
+                worker.start()
+                self.workers.append(worker)
+        except Exception as err:
+            print(f"Warm-up failed: {err!r}")
+            self.status = "failed"
+            self.error = repr(err)
+        else:
+            self.status = "ready"
+        finally:
+            self.seconds = round(time.monotonic() - started, 3)
+            print(f"Warm-up {self.status} after {self.seconds} seconds")
+
+    def report(self) -> dict:
+        """Warm-up state for the readiness endpoint"""
+        return {"status": self.status, "seconds": self.seconds, "error": self.error}
+
+    def start(self):
+        """Start warming up on the running event loop"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Cancel an unfinished warm-up and stop the workers it started"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for worker in reversed(self.workers):
+            await worker.stop()
+        self.workers = []
+
+
+warmup = Warmup()
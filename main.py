@@ -1,12 +1,37 @@
 """Main file of the application."""
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 
+from app import metrics
+from app.build_queue import build_queue
+from app.config import Environ
+from app.jobs import jobs
 from app.routes import router
+from app.warmup import warmup
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """Start and stop the build workers with the application"""
+    Environ.validate()
+    jobs.recover()
+    build_queue.start()
+    # Services load in the background, so the server is up right away
+    warmup.start()
+    yield
+    await build_queue.stop()
+    await warmup.stop()
+
+    from app.services.http import close_http_clients
+
+    await close_http_clients()
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.include_router(router)
 
 # Add CORS. Allow all origins (for testing / public API)
@@ -24,3 +49,17 @@ app.add_middleware(
 async def index():
     """Home page"""
     return {"message": "Welcome to Niloy's App Builder"}
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe, 503 until the services have warmed up"""
+    return JSONResponse(warmup.report(), status_code=200 if warmup.ready else 503)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus metrics"""
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""Offline load test of the /build pipeline.
+
+Starts local stand-ins for aipipe, the Github REST API, Github Pages and
+the evaluation URL, runs the app with its endpoints pointed at them, and
+replays test_payloads/*.json against /build at a chosen concurrency.
+Reports throughput and p50/p99 latency per pipeline stage, without
+spending any API quota.
+
+    python scripts/loadtest.py --concurrency 16 --repeat 5 --llm-latency 3
+"""
+
+import argparse
+import asyncio
+import base64
+import contextlib
+import glob
+import hashlib
+import io
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+SECRET = "loadtest-secret"
+OWNER = "loadtest"
+
+# The app subprocess inherits these, the stand-ins reuse its mock LLM
+os.environ.update(API_SECRET=SECRET, GITHUB_TOKEN="loadtest", AI_PIPE_API_KEY="loadtest")
+sys.path.insert(0, str(REPO_ROOT))
+
+from app.services.llm_mock import generate_app_mock  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--payloads", default=str(REPO_ROOT / "test_payloads" / "*.json"))
+    parser.add_argument("--concurrency", type=int, default=8, help="builds in flight")
+    parser.add_argument("--repeat", type=int, default=1, help="times to replay each payload")
+    parser.add_argument("--workers", type=int, default=4, help="BUILD_WORKERS of the app")
+    parser.add_argument("--queue-size", type=int, default=32, help="BUILD_QUEUE_SIZE of the app")
+    parser.add_argument("--llm-latency", type=float, default=2.0, help="mean LLM seconds")
+    parser.add_argument("--llm-jitter", type=float, default=0.5, help="LLM latency stddev")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="share of 503s")
+    parser.add_argument("--github-latency", type=float, default=0.05, help="seconds per call")
+    parser.add_argument("--pages-delay", type=float, default=1.0, help="seconds to build Pages")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds per build")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--env",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="extra app setting such as GITHUB_WRITE_RATE=300, repeatable",
+    )
+    return parser.parse_args()
+
+
+def blob_sha(content: bytes) -> str:
+    return hashlib.sha1(b"blob %d\0%s" % (len(content), content)).hexdigest()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class FakeServices:
+    """Stand-ins for aipipe, the Github REST API, Pages sites and the evaluation URL"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.repos: dict[str, dict] = {}
+        self.callbacks: list[dict] = []
+        self.llm_calls = 0
+        self.llm_errors = 0
+        self.github_calls = 0
+        self.app = FastAPI()
+        self.app.post("/aipipe/chat/completions")(self.chat)
+        self.app.api_route(
+            "/github/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE"]
+        )(self.github)
+        self.app.get("/pages/{owner}/{name}/")(self.pages)
+        self.app.post("/eval")(self.evaluation)
+
+    async def chat(self, request: Request):
+        """Chat completions with injected latency and errors"""
+        body = await request.json()
+        self.llm_calls += 1
+        await asyncio.sleep(max(random.gauss(self.args.llm_latency, self.args.llm_jitter), 0))
+        if random.random() < self.args.llm_error_rate:
+            self.llm_errors += 1
+            return JSONResponse({"error": "injected failure"}, status_code=503)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = generate_app_mock(body["messages"][1]["content"], "")
+        content = json.dumps(response.model_dump(by_alias=True, exclude_none=True))
+        if not body.get("stream"):
+            return {"choices": [{"message": {"content": content}}]}
+
+        async def events():
+            for start in range(0, len(content), 64):
+                delta = {"choices": [{"delta": {"content": content[start : start + 64]}}]}
+                yield f"data: {json.dumps(delta)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    def _repo(self, name: str) -> dict:
+        return {
+            "name": name,
+            "full_name": f"{OWNER}/{name}",
+            "html_url": f"https://github.com/{OWNER}/{name}",
+        }
+
+    def _commit(self, repo: dict, tree: dict[str, str], parent: str | None) -> str:
+        tree_sha = hashlib.sha1(json.dumps(sorted(tree.items())).encode()).hexdigest()
+        repo["trees"][tree_sha] = tree
+        sha = hashlib.sha1(f"{tree_sha}{parent}{time.time_ns()}".encode()).hexdigest()
+        repo["commits"][sha] = tree_sha
+        return sha
+
+    def _moved(self, repo: dict, sha: str):
+        repo["ref"] = sha
+        repo["built_at"] = time.monotonic() + self.args.pages_delay
+
+    async def github(self, path: str, request: Request):
+        """The subset of the REST API that the pipeline uses"""
+        self.github_calls += 1
+        await asyncio.sleep(self.args.github_latency)
+        method = request.method
+        raw = await request.body()
+        data = json.loads(raw) if raw else None
+        missing = JSONResponse({"message": "Not Found"}, status_code=404)
+
+        if path == "user":
+            return {"login": OWNER}
+        if path == "user/repos" and method == "POST":
+            self.repos[data["name"]] = {"ref": None, "trees": {}, "commits": {}, "pages": False}
+            return JSONResponse(self._repo(data["name"]), status_code=201)
+
+        parts = path.split("/")
+        if parts[0] != "repos" or len(parts) < 3 or parts[2] not in self.repos:
+            return missing
+        name, rest = parts[2], "/".join(parts[3:])
+        repo = self.repos[name]
+
+        if rest == "":
+            if method == "DELETE":
+                del self.repos[name]
+                return Response(status_code=204)
+            if method == "PATCH" and "name" in data:
+                self.repos[data["name"]] = self.repos.pop(name)
+                return self._repo(data["name"])
+            return self._repo(name)
+        if rest in ("git/ref/heads/main", "git/refs/heads/main"):
+            if method == "PATCH":
+                self._moved(repo, data["sha"])
+                return {"object": {"sha": data["sha"]}}
+            if repo["ref"] is None:
+                return JSONResponse({"message": "Git Repository is empty."}, status_code=409)
+            return {"object": {"sha": repo["ref"]}}
+        if rest.startswith("contents/") and method == "PUT":
+            parent = repo["ref"]
+            tree = dict(repo["trees"][repo["commits"][parent]]) if parent else {}
+            tree[rest.removeprefix("contents/")] = blob_sha(base64.b64decode(data["content"]))
+            sha = self._commit(repo, tree, parent)
+            self._moved(repo, sha)
+            commit = {"sha": sha, "tree": {"sha": repo["commits"][sha]}}
+            return JSONResponse({"commit": commit}, status_code=201)
+        if rest == "git/blobs":
+            return JSONResponse(
+                {"sha": blob_sha(base64.b64decode(data["content"]))}, status_code=201
+            )
+        if rest == "git/trees":
+            tree = dict(repo["trees"].get(data.get("base_tree"), {}))
+            tree.update({item["path"]: item["sha"] for item in data["tree"]})
+            tree_sha = hashlib.sha1(json.dumps(sorted(tree.items())).encode()).hexdigest()
+            repo["trees"][tree_sha] = tree
+            return JSONResponse({"sha": tree_sha}, status_code=201)
+        if rest.startswith("git/trees/"):
+            tree = repo["trees"].get(parts[-1], {})
+            items = [{"path": p, "type": "blob", "sha": s} for p, s in tree.items()]
+            return {"sha": parts[-1], "tree": items}
+        if rest == "git/commits":
+            sha = hashlib.sha1(raw + str(time.time_ns()).encode()).hexdigest()
+            repo["commits"][sha] = data["tree"]
+            return JSONResponse({"sha": sha, "tree": {"sha": data["tree"]}}, status_code=201)
+        if rest.startswith("git/commits/") and parts[-1] in repo["commits"]:
+            return {"sha": parts[-1], "tree": {"sha": repo["commits"][parts[-1]]}}
+        if rest == "pages":
+            if method == "POST":
+                repo["pages"] = True
+                return JSONResponse({}, status_code=201)
+            return {"status": "built"} if repo["pages"] else missing
+        if rest == "pages/builds/latest":
+            if not repo["pages"] or repo["ref"] is None:
+                return missing
+            built = time.monotonic() >= repo["built_at"]
+            return {"status": "built" if built else "building", "commit": repo["ref"]}
+        return missing
+
+    async def pages(self, owner: str, name: str):
+        """A Pages site, live once its latest commit is built"""
+        repo = self.repos.get(name)
+        if owner != OWNER or not repo or not repo["pages"] or repo["ref"] is None:
+            return Response(status_code=404)
+        if time.monotonic() < repo["built_at"]:
+            return Response(status_code=404)
+        return Response("<!DOCTYPE html><title>ok</title>", media_type="text/html")
+
+    async def evaluation(self, request: Request):
+        """Evaluation receiver"""
+        self.callbacks.append(await request.json())
+        return {"status": "success"}
+
+
+class LoadStats:
+    """Outcome of every replayed build"""
+
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.stages: dict[str, list[float]] = {}
+        self.outcomes: dict[str, int] = {}
+        self.rejections = 0
+
+    def record(self, job: dict, seconds: float):
+        self.outcomes[job["status"]] = self.outcomes.get(job["status"], 0) + 1
+        if job["status"] == "succeeded":
+            self.latencies.append(seconds)
+        for name, stage in job["stages"].items():
+            if stage["status"] == "done":
+                self.stages.setdefault(name, []).append(stage["seconds"])
+
+
+async def run_build(
+    client: httpx.AsyncClient, payload: dict, stats: LoadStats, timeout: float
+):
+    """Submit one build, retrying on 429, and wait for its job to finish"""
+    started = time.monotonic()
+    while True:
+        response = await client.post("/build", json=payload)
+        if response.status_code != 429:
+            break
+        stats.rejections += 1
+        await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+    response.raise_for_status()
+    job_id = response.json()["job_id"]
+
+    job = {"status": "timeout", "stages": {}}
+    while time.monotonic() - started < timeout:
+        await asyncio.sleep(0.25)
+        job = (await client.get(f"/jobs/{job_id}")).json()
+        if job["status"] in ("succeeded", "failed"):
+            break
+    stats.record(job, time.monotonic() - started)
+
+
+def load_payloads(pattern: str, repeat: int, fake_url: str) -> list[dict]:
+    """Give every replay its own task and nonce so none are deduplicated"""
+    templates = [json.loads(Path(path).read_text()) for path in sorted(glob.glob(pattern))]
+    run_id = int(time.time())
+    payloads = []
+    for _ in range(repeat):
+        for template in templates:
+            payload = dict(template)
+            payload["task"] = f"{template['task']}-lt{len(payloads)}"
+            payload["nonce"] = f"loadtest-{run_id}-{len(payloads)}"
+            payload["secret"] = SECRET
+            payload["evaluation_url"] = f"{fake_url}/eval"
+            payloads.append(payload)
+    return payloads
+
+
+def start_app(args: argparse.Namespace, fake_url: str, port: int, workdir: str):
+    """Run the app in a subprocess with every endpoint pointed at the stand-ins"""
+    env = {
+        **os.environ,
+        "AIPIPE_URL": f"{fake_url}/aipipe/chat/completions",
+        "GITHUB_API_URL": f"{fake_url}/github",
+        "PAGES_URL_TEMPLATE": f"{fake_url}/pages/{{owner}}/{{name}}/",
+        "STATE_DB": os.path.join(workdir, "state.db"),
+        "LLM_CACHE_SIZE": "0",
+        "LLM_CACHE_DIR": "",
+        "BUILD_WORKERS": str(args.workers),
+        "BUILD_QUEUE_SIZE": str(args.queue_size),
+        "BUILD_QUEUE_PER_EMAIL": str(args.queue_size),
+        "PAGES_PROBE_INTERVAL": "0.5",
+    }
+    env.update(setting.split("=", 1) for setting in args.env)
+    log = open(os.path.join(workdir, "app.log"), "w")
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1"]
+    command += ["--port", str(port), "--log-level", "warning"]
+    return subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_ready(client: httpx.AsyncClient, process: subprocess.Popen):
+    for _ in range(150):
+        if process.poll() is not None:
+            raise RuntimeError("App exited during startup, see app.log")
+        try:
+            if (await client.get("/ready")).is_success:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("App did not become ready")
+
+
+def report(stats: LoadStats, fakes: FakeServices, submitted: int, wall: float):
+    finished = stats.outcomes.get("succeeded", 0)
+    print()
+    print(f"Builds:      {submitted} submitted, " + ", ".join(
+        f"{count} {status}" for status, count in sorted(stats.outcomes.items())
+    ))
+    print(f"Rejections:  {stats.rejections} (429, retried after Retry-After)")
+    print(f"Callbacks:   {len(fakes.callbacks)} received")
+    print(f"LLM calls:   {fakes.llm_calls} ({fakes.llm_errors} injected errors)")
+    print(f"Github calls: {fakes.github_calls}")
+    print(f"Wall time:   {wall:.1f} s")
+    print(f"Throughput:  {finished / wall:.2f} builds/s ({finished / wall * 60:.1f} per minute)")
+    print()
+    rows = [("end_to_end", stats.latencies), *stats.stages.items()]
+    print(f"{'stage':<20}{'count':>7}{'p50 (s)':>10}{'p99 (s)':>10}{'max (s)':>10}")
+    for name, values in rows:
+        if values:
+            print(
+                f"{name:<20}{len(values):>7}{percentile(values, 50):>10.3f}"
+                f"{percentile(values, 99):>10.3f}{max(values):>10.3f}"
+            )
+
+
+async def run(args: argparse.Namespace) -> int:
+    fakes = FakeServices(args)
+    fake_port, app_port = free_port(), free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    server = uvicorn.Server(
+        uvicorn.Config(fakes.app, host="127.0.0.1", port=fake_port, log_level="warning")
+    )
+    server_task = asyncio.create_task(server.serve())
+
+    payloads = load_payloads(args.payloads, args.repeat, fake_url)
+    if not payloads:
+        print(f"No payloads match {args.payloads}", file=sys.stderr)
+        return 1
+
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    process = start_app(args, fake_url, app_port, workdir)
+    print(f"App log: {os.path.join(workdir, 'app.log')}")
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{app_port}", timeout=30, limits=limits
+        ) as client:
+            await wait_ready(client, process)
+            print(f"Replaying {len(payloads)} builds at concurrency {args.concurrency}...")
+            stats = LoadStats()
+            in_flight = asyncio.Semaphore(args.concurrency)
+
+            async def bounded(payload: dict):
+                async with in_flight:
+                    await run_build(client, payload, stats, args.timeout)
+
+            started = time.monotonic()
+            await asyncio.gather(*(bounded(payload) for payload in payloads))
+            wall = time.monotonic() - started
+            # Give the outbox a moment to deliver the last callbacks
+            for _ in range(20):
+                if len(fakes.callbacks) >= stats.outcomes.get("succeeded", 0):
+                    break
+                await asyncio.sleep(0.25)
+    finally:
+        process.terminate()
+        process.wait(10)
+        server.should_exit = True
+        await server_task
+
+    report(stats, fakes, len(payloads), wall)
+    return 0 if stats.outcomes.get("succeeded", 0) == len(payloads) else 1
+
+
+def main() -> int:
+    args = parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
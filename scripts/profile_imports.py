@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Import-time profile of the app, the main part of its cold start.
+
+Imports main in fresh interpreters with `python -X importtime` and
+reports the fastest run: total time, the heaviest packages, and every
+app module. The service modules that the warm-up loads after startup are
+profiled separately, since they are off the critical path.
+
+    python scripts/profile_imports.py --runs 5 --budget 800
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from app.warmup import SERVICE_MODULES  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters per profile")
+    parser.add_argument("--top", type=int, default=10, help="heaviest packages to list")
+    parser.add_argument(
+        "--budget", type=float, default=None, help="fail when importing main takes longer (ms)"
+    )
+    return parser.parse_args()
+
+
+def profile(statement: str, workdir: str) -> list[tuple[str, int, int]]:
+    """Run statement in a fresh interpreter and return (module, self, cumulative) in us"""
+    # Importing the app opens the state database, keep it out of the repo
+    env = {**os.environ, "STATE_DB": os.path.join(workdir, "state.db")}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=REPO_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        own, cumulative, name = line.removeprefix("import time:").split("|")
+        # Nested imports are indented by two spaces per level
+        rows.append((name[1:].rstrip(), int(own), int(cumulative)))
+    return rows
+
+
+def total(rows: list[tuple[str, int, int]]) -> int:
+    """Sum the cumulative time of the top-level imports"""
+    return sum(cumulative for name, _, cumulative in rows if not name.startswith(" "))
+
+
+def fastest(statement: str, runs: int, workdir: str) -> list[tuple[str, int, int]]:
+    return min((profile(statement, workdir) for _ in range(runs)), key=total)
+
+
+def report(rows: list[tuple[str, int, int]], top: int):
+    packages: dict[str, int] = {}
+    for name, own, _ in rows:
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + own
+    print(f"{'package':<28} {'self (ms)':>10}")
+    for package, own in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"{package:<28} {own / 1000:>10.1f}")
+    print()
+    print(f"{'app module':<28} {'self (ms)':>10} {'cumulative (ms)':>16}")
+    for name, own, cumulative in rows:
+        module = name.strip()
+        if module == "main" or module.split(".")[0] == "app":
+            print(f"{module:<28} {own / 1000:>10.1f} {cumulative / 1000:>16.1f}")
+
+
+def main() -> int:
+    args = parse_args()
+    with tempfile.TemporaryDirectory(prefix="profile-imports-") as workdir:
+        startup = fastest("import main", args.runs, workdir)
+        warm = fastest(
+            "import main\n" + "".join(f"import {name}\n" for name in SERVICE_MODULES),
+            args.runs,
+            workdir,
+        )
+
+    startup_ms = next(cumulative for name, _, cumulative in startup if name == "main") / 1000
+    print(f"import main: {startup_ms:.1f} ms (fastest of {args.runs})")
+    print(f"Interpreter startup imports: {total(startup) / 1000 - startup_ms:.1f} ms")
+    print()
+    report(startup, args.top)
+    loaded = {name.strip() for name, _, _ in startup}
+    deferred = [row for row in warm if row[0].strip() not in loaded]
+    print()
+    print(f"Loaded by the warm-up after startup: {total(deferred) / 1000:.1f} ms")
+    print()
+    report(deferred, args.top)
+
+    if args.budget is not None and startup_ms > args.budget:
+        print(f"\nimport main exceeds the budget of {args.budget:.0f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Test the repairs that the JSON engine applies to LLM output
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from app.services.json_repair import extract_json
+
+
+def test_code_fence():
+    """A ```json fence around the object is stripped"""
+    data, repairs = extract_json('```json\n{"index.html": "<p>x</p>"}\n```')
+    assert data == {"index.html": "<p>x</p>"}
+    assert "stripped code fence" in repairs
+
+
+def test_brace_inside_js_string():
+    """Braces inside a string do not end the object early"""
+    html = "<script>const s = '}'; if (a) { b(); }</script>"
+    data, repairs = extract_json('{"index.html": "' + html + '", "LICENSE": "MIT"} trailing')
+    assert data == {"index.html": html, "LICENSE": "MIT"}
+    assert "dropped text after object" in repairs
+
+
+def test_trailing_commas():
+    """Commas before a closing brace or bracket are removed"""
+    data, repairs = extract_json('{"a": [1, 2,], "b": {"c": 3,},}')
+    assert data == {"a": [1, 2], "b": {"c": 3}}
+    assert "removed trailing comma" in repairs
+
+
+def test_invalid_escape():
+    """A backslash before a character JSON cannot escape is kept literally"""
+    data, repairs = extract_json(r'{"index.html": "price: \$5, regex \d+"}')
+    assert data == {"index.html": r"price: \$5, regex \d+"}
+    assert "fixed invalid escape" in repairs
+
+
+def test_double_escaped_newlines():
+    """\\\\n in a string without real newlines becomes a newline"""
+    data, repairs = extract_json(r'{"README.md": "# App\\n\\nText"}')
+    assert data == {"README.md": "# App\n\nText"}
+    assert "fixed double-escaped newlines" in repairs
+
+
+def test_literal_backslash_n_kept_beside_real_newlines():
+    """A string that already uses real newlines keeps its literal \\\\n"""
+    data, _ = extract_json(r'{"index.html": "line\nsplit(\"\\n\")"}')
+    assert data == {"index.html": 'line\nsplit("\\n")'}
+
+
+def test_escaped_property_names():
+    """Escaped quotes around a property name are unescaped"""
+    data, repairs = extract_json(r'{\"README.md\": "x", \"index.html\": "<p>x</p>"}')
+    assert data == {"README.md": "x", "index.html": "<p>x</p>"}
+    assert "unescaped property name" in repairs
+
+
+def test_escaped_name_does_not_leak_into_value():
+    """Escaped quotes in a value after an escaped name stay escaped"""
+    data, _ = extract_json(r'{\"README.md": "say \"hi\" there", "index.html": "<p>x</p>"}')
+    assert data == {"README.md": 'say "hi" there', "index.html": "<p>x</p>"}
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
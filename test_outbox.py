@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Test that undeliverable evaluation callbacks back off and get dead-lettered
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from app.config import Environ
+from app.db import Database
+from app.outbox import Outbox, OutboxDispatcher
+
+INVALID_URL = "http://[::1"
+
+
+def make_outbox() -> Outbox:
+    """Outbox in a fresh database file"""
+    path = os.path.join(tempfile.mkdtemp(prefix="test-outbox-"), "state.db")
+    return Outbox(Database(path))
+
+
+def test_invalid_url_counts_as_attempt():
+    """A malformed URL is retried later instead of staying due"""
+    outbox = make_outbox()
+    entry_id = outbox.add(INVALID_URL, {"task": "t"})
+    asyncio.run(OutboxDispatcher(outbox).dispatch_due())
+
+    rows = outbox.db.query("SELECT * FROM outbox WHERE id = ?", (entry_id,))
+    assert len(rows) == 1
+    assert rows[0]["attempts"] == 1
+    assert "InvalidURL" in rows[0]["last_error"]
+    assert rows[0]["next_attempt"] >= rows[0]["created"]
+
+
+def test_invalid_url_is_dead_lettered():
+    """A malformed URL ends up in the dead-letter table after the last attempt"""
+    outbox = make_outbox()
+    entry_id = outbox.add(INVALID_URL, {"task": "t"})
+    max_attempts = Environ.OUTBOX_MAX_ATTEMPTS
+    Environ.OUTBOX_MAX_ATTEMPTS = 1
+    try:
+        asyncio.run(OutboxDispatcher(outbox).dispatch_due())
+    finally:
+        Environ.OUTBOX_MAX_ATTEMPTS = max_attempts
+
+    assert outbox.db.query("SELECT * FROM outbox") == []
+    dead = outbox.db.query("SELECT * FROM dead_letter WHERE id = ?", (entry_id,))
+    assert len(dead) == 1
+    assert dead[0]["attempts"] == 1
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -44,8 +44,12 @@ print("-" * 60)
 checks = "- document.title === 'Test'\n- document.querySelector('#test')"
 brief = "Create a simple test page"
 
-final_instructions = instructions.replace("{checks}", checks)
-final_input = user_input.replace("{brief}", brief)
+final_instructions = instructions
+final_input = (
+    user_input.replace("{brief}", brief)
+    .replace("{checks}", checks)
+    .replace("{attachments}", "None.")
+)
 
 print("\n✅ FINAL SYSTEM PROMPT:")
 print("-" * 60)